@@ -1,6 +1,29 @@
 """Checkers game"""
 
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
 import os
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import namedtuple
+from collections.abc import Mapping
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, only batch APIs make use of it
+    numpy = None
 
 # Display representation of "reachable" squares
 PIECE_DISP = {
@@ -27,25 +50,337 @@ BOX = {
     "cc": "\u253c",
 }
 
+# Static lines of the board frame
+_HBX3 = BOX["hb"] * 3
+BOARD_TOP = BOX["ul"] + (_HBX3+BOX["nt"]) * 7 + _HBX3 + BOX["ur"]
+BOARD_MID = BOX["wt"] + (_HBX3+BOX["cc"]) * 7 + _HBX3 + BOX["et"]
+BOARD_BOTTOM = BOX["ll"] + (_HBX3+BOX["st"]) * 7 + _HBX3 + BOX["lr"]
+# ANSI escape sequences: clear the screen and move the cursor home, move
+# the cursor to a (line, column), clear to the end of line and of screen,
+# save the cursor position and restore it
+ANSI_CLEAR = "\x1b[2J\x1b[H"
+ANSI_MOVE_TO = "\x1b[{};{}H"
+ANSI_CLEAR_LINE = "\x1b[K"
+ANSI_CLEAR_BELOW = "\x1b[J"
+ANSI_SAVE_CURSOR = "\x1b7"
+ANSI_RESTORE_CURSOR = "\x1b8"
+
+# Diagonal directions, in the order moves and jumps are listed:
+# 'NW': toward corner of board near square 0
+# 'NE': toward corner of board near square 3
+# 'SW': toward corner of board near square 28
+# 'SE': toward corner of board near square 31
+DIRECTIONS = ("SE", "SW", "NE", "NW")
+# Directions each piece may move in ("bm" moves south, "wm" north)
+PIECE_DIRS = {
+    "bm": ("SE", "SW"),
+    "wm": ("NE", "NW"),
+    "bk": DIRECTIONS,
+    "wk": DIRECTIONS,
+}
+
+
+def _build_diagonal_tables():
+    """Return the neighbor and jump landing tables of the board
+
+    Both tables map a direction to a 32-tuple indexed by square, holding
+    the index of the diagonally adjacent square (neighbor) or the square
+    two steps away (landing) in that direction, or None off the board.
+    """
+    # (row, column) change of one step in each direction
+    deltas = {"NW": (-1, -1), "NE": (-1, 1), "SW": (1, -1), "SE": (1, 1)}
+
+    def step(square, direction, distance):
+        row, col = divmod(square, 4)
+        # Column on the 8x8 board; rows 1, 3, 5, 7 start with a white square
+        col = col*2 + (0 if row % 2 else 1)
+        row += deltas[direction][0] * distance
+        col += deltas[direction][1] * distance
+        if 0 <= row < 8 and 0 <= col < 8:
+            return row*4 + col//2
+        return None
+
+    neighbors = {d: tuple(step(sq, d, 1) for sq in range(32))
+                 for d in DIRECTIONS}
+    landings = {d: tuple(step(sq, d, 2) for sq in range(32))
+                for d in DIRECTIONS}
+    return neighbors, landings
+
+
+# Pieces by their small integer code, used to store and index them
+PIECES = ("", "bm", "bk", "wm", "wk")
+EMPTY, BLACK_MAN, BLACK_KING, WHITE_MAN, WHITE_KING = range(len(PIECES))
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+KING_CODES = (BLACK_KING, WHITE_KING)
+# Piece codes of the starting position
+INITIAL_CELLS = bytes([BLACK_MAN] * 12 + [EMPTY] * 8 + [WHITE_MAN] * 12)
+
+NEIGHBOR_SQ, JUMP_SQ = _build_diagonal_tables()
+# For each piece code and square, the (neighbor, landing) pairs in the
+# directions the piece may move in, skipping directions that lead off the
+# board
+PIECE_STEPS = tuple(
+    tuple(
+        tuple((NEIGHBOR_SQ[d][sq], JUMP_SQ[d][sq])
+              for d in PIECE_DIRS.get(piece, ())
+              if NEIGHBOR_SQ[d][sq] is not None)
+        for sq in range(32))
+    for piece in PIECES)
+# Squares whose piece may gain or lose a move or jump when a square changes:
+# the square itself and the squares one and two steps away diagonally, as
+# indices and as a bitboard
+AFFECTED_SQ = tuple(
+    tuple(sorted({sq} | {table[d][sq]
+                         for table in (NEIGHBOR_SQ, JUMP_SQ)
+                         for d in DIRECTIONS} - {None}))
+    for sq in range(32))
+AFFECTED_BITS = tuple(sum(1 << sq for sq in squares)
+                      for squares in AFFECTED_SQ)
+# Captured square of each jump, keyed by (from, landing) square indices
+CAPTURED_SQ = {
+    (sq, JUMP_SQ[d][sq]): NEIGHBOR_SQ[d][sq]
+    for d in DIRECTIONS for sq in range(32) if JUMP_SQ[d][sq] is not None
+}
+
+# Piece codes of each side, keyed by blacks_turn
+SIDE_PIECES = {True: (BLACK_MAN, BLACK_KING), False: (WHITE_MAN, WHITE_KING)}
+# Side (blacks_turn) of each piece code, None for an empty square
+PIECE_SIDE = (None, True, True, False, False)
+# Squares of the kings row each side moves toward, keyed by blacks_turn
+KINGS_ROW = {True: frozenset(range(28, 32)), False: frozenset(range(4))}
+
+# Zobrist keys: a random 64-bit number per piece and square, XOR-ed
+# together over the occupied squares to hash a position. Empty squares have
+# key 0. The keys are generated from a fixed seed so that hashes are
+# reproducible across processes and runs.
+_zobrist_rng = random.Random(0x636865636b657273)
+_zobrist_keys = {
+    piece: tuple(_zobrist_rng.getrandbits(64) if piece else 0
+                 for _ in range(32))
+    for piece in PIECE_DISP
+}
+# Keys indexed by piece code, then square
+ZOBRIST_KEYS = tuple(_zobrist_keys[piece] for piece in PIECES)
+# Zobrist key XOR-ed into the hash when it is white's turn
+ZOBRIST_WHITE_TO_MOVE = _zobrist_rng.getrandbits(64)
+del _zobrist_rng, _zobrist_keys
+
+# Crowned piece code of each man
+CROWNS = {BLACK_MAN: BLACK_KING, WHITE_MAN: WHITE_KING}
+
+# A complete move: path is the tuple of squares the piece visits, starting
+# with its origin, and captures the tuple of squares of the jumped pieces
+Move = namedtuple("Move", "path captures")
+
+# Packed position: the black, white and kings bitboards (see BitBoard) and
+# the side to move (1 if black), 13 bytes in little-endian byte order
+POSITION_STRUCT = struct.Struct("<IIIB")
+# Array typecode of unsigned 32-bit integers
+U32 = "I" if array("I").itemsize == 4 else "L"
+
+# Bound type of a score stored in the transposition table
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+# Transposition table replacement policies
+TT_POLICIES = ("always", "depth", "two-tier")
+
+# A transposition table entry. Move is the (from, to) squares of the best
+# move found, or None.
+TTEntry = namedtuple("TTEntry", "depth bound score move")
+
+# Game results in Portable Draughts Notation; black moves first
+BLACK_WINS = "1-0"
+WHITE_WINS = "0-1"
+DRAW = "1/2-1/2"
+
+# Draw rules of unattended games: the number of times a position may occur,
+# and the number of plies a game may last
+DRAW_REPETITIONS = 3
+MAX_GAME_PLIES = 200
+# Why a game ended, when it ended by a draw rule
+REPETITION = "repetition"
+PLY_LIMIT = "ply limit"
+
+# Result tokens in PDN move text, and the game result each stands for
+PDN_RESULTS = {
+    "1-0": BLACK_WINS, "2-0": BLACK_WINS,
+    "0-1": WHITE_WINS, "0-2": WHITE_WINS,
+    "1/2-1/2": DRAW, "1-1": DRAW,
+    "*": None,
+}
+# A game read from a PDN file: its tags (a dict), the moves and result as
+# written, the Game the moves were replayed in and, if a move could not be
+# replayed, the error message. The game then holds the moves before it.
+PdnGame = namedtuple("PdnGame", "tags moves result game error")
+
+# Kinds of errors found when validating game archives
+MISSED_JUMP = "missed jump"
+INCOMPLETE_JUMP = "incomplete jump"
+MOVE_AFTER_END = "move after end"
+ILLEGAL_MOVE = "illegal move"
+BAD_RECORD = "bad record"
+# Number of games sent to a validator worker process at a time
+VALIDATE_BATCH = 200
+
+# Commands of the game server line protocol
+SERVER_COMMANDS = ("NEW", "JOIN", "MOVE", "BOARD", "MOVES", "RESIGN", "QUIT")
+SIDE_NAMES = {True: "black", False: "white"}
+
+# Move log record: type, game number and payload size, followed by the
+# payload and the CRC-32 of header and payload. The payload of LOG_START
+# is the position and the players' names, each preceded by its size.
+LOG_HEADER = struct.Struct("<BIH")
+LOG_CRC = struct.Struct("<I")
+LOG_START, LOG_MOVE, LOG_END = 1, 2, 3
+LOG_MAX_PAYLOAD = 0xFFFF
+# Longest player name in UTF-8 bytes, as the log and snapshots store it
+MAX_NAME_SIZE = 255
+# Move log snapshot: magic, log offset it covers and number of games, then
+# the number, position and name sizes of each game followed by its names,
+# and the CRC-32 of all that
+SNAPSHOT_MAGIC = b"CKS1"
+SNAPSHOT_HEADER = struct.Struct("<4sQI")
+SNAPSHOT_GAME = struct.Struct("<I{}sBB".format(POSITION_STRUCT.size))
+
+# Binomial coefficients: BINOMIAL[n][k] is n choose k
+BINOMIAL = tuple(tuple(math.comb(n, k) for k in range(33)) for n in range(33))
+# Outcome of a tablebase position for the side to move, and the entry of a
+# position: its outcome and the distance in plies to the end of the game
+TB_LOSS, TB_DRAW, TB_WIN = -1, 0, 1
+TBEntry = namedtuple("TBEntry", "outcome plies")
+# (first square, number of squares) each piece type may stand on, in the
+# order of the piece codes: men never stand on their kings row
+TB_GROUPS = ((0, 28), (0, 32), (4, 28), (0, 32))
+# Tablebase file: magic, largest number of pieces and number of material
+# signatures, then per signature the number of black men, black kings,
+# white men and white kings and the file offset of its table
+TB_MAGIC = b"CKTB"
+TB_HEADER = struct.Struct("<4sBI")
+TB_MATERIAL = struct.Struct("<4BQ")
+
+# Opening book file: magic and number of entries, then the entries sorted
+# by position hash: hash, first and last square of the move, the number of
+# games it was played in and the points it scored for the side playing it,
+# 2 for a win and 1 for a draw
+BOOK_MAGIC = b"CKBK"
+BOOK_HEADER = struct.Struct("<4sI")
+BOOK_ENTRY = struct.Struct("<QBBII")
+# Points of each game result for white and black, indexed by blacks_turn
+BOOK_POINTS = {BLACK_WINS: (0, 2), WHITE_WINS: (2, 0), DRAW: (1, 1)}
+BookMove = namedtuple("BookMove", "move games points")
+
+# Search scores: value of each piece, and the score of a won position
+MAN_VALUE = 100
+KING_VALUE = 150
+WIN_SCORE = 100000
+# Scores beyond +-WIN_BOUND are wins or losses a known number of plies away
+WIN_BOUND = WIN_SCORE - 1000
+# The computer offers a draw once this many searches in a row have scored
+# an endgame of at most DRAW_OFFER_PIECES pieces within DRAW_MARGIN of level
+DRAW_OFFER_SEARCHES = 10
+DRAW_OFFER_PIECES = 8
+DRAW_MARGIN = 50
+
+# Result of a search. Move is the best move found at the deepest completed
+# depth, pv the principal variation (a tuple of moves) starting with it.
+# Nodes counts the main search, qnodes the quiescence search and nps both.
+SearchResult = namedtuple("SearchResult",
+                          "move score depth nodes elapsed nps pv qnodes",
+                          defaults=(0,))
+
+# Bitboard layout: bit n of a 32-bit integer represents square index n (0-31)
+FULL_BOARD = 0xFFFFFFFF
+# Rows whose first square is white (board rows 1, 3, 5, 7) and their
+# complement, the rows whose first square is black
+EVEN_ROWS = 0x0F0F0F0F
+ODD_ROWS = 0xF0F0F0F0
+# Leftmost and rightmost reachable square of each row
+LEFT_EDGE = 0x11111111
+RIGHT_EDGE = 0x88888888
+TOP_ROW = 0x0000000F
+BOTTOM_ROW = 0xF0000000
+# Each diagonal direction shifts a square index by a row parity dependent
+# amount. The source mask of a direction and shift holds the squares that
+# step by that shift, those with no neighbor in the direction excluded.
+STEP_NW4 = EVEN_ROWS & ~TOP_ROW
+STEP_NW5 = ODD_ROWS & ~LEFT_EDGE
+STEP_NE4 = ODD_ROWS
+STEP_NE3 = EVEN_ROWS & ~RIGHT_EDGE & ~TOP_ROW
+STEP_SW4 = EVEN_ROWS
+STEP_SW3 = ODD_ROWS & ~LEFT_EDGE & ~BOTTOM_ROW
+STEP_SE4 = ODD_ROWS & ~BOTTOM_ROW
+STEP_SE5 = EVEN_ROWS & ~RIGHT_EDGE
+# A direction as (source mask, shift) pairs
+BIT_STEPS = {
+    "NW": ((STEP_NW4, -4), (STEP_NW5, -5)),
+    "NE": ((STEP_NE4, -4), (STEP_NE3, -3)),
+    "SW": ((STEP_SW4, 4), (STEP_SW3, 3)),
+    "SE": ((STEP_SE4, 4), (STEP_SE5, 5)),
+}
+# Source masks of the steps by 4 in either direction south or north
+STEP_S4 = STEP_SE4 | STEP_SW4
+STEP_N4 = STEP_NE4 | STEP_NW4
+# Source masks of the jumps in each direction, by the shift to the captured
+# piece. A jump lands 9 (NW, SE) or 7 (NE, SW) squares away.
+JUMP_NW4 = STEP_NW4 & FULL_BOARD << 8 & ~LEFT_EDGE
+JUMP_NW5 = STEP_NW5 & FULL_BOARD << 8 & ~LEFT_EDGE
+JUMP_NE4 = STEP_NE4 & FULL_BOARD << 8 & ~RIGHT_EDGE
+JUMP_NE3 = STEP_NE3 & FULL_BOARD << 8 & ~RIGHT_EDGE
+JUMP_SW4 = STEP_SW4 & FULL_BOARD >> 8 & ~LEFT_EDGE
+JUMP_SW3 = STEP_SW3 & FULL_BOARD >> 8 & ~LEFT_EDGE
+JUMP_SE4 = STEP_SE4 & FULL_BOARD >> 8 & ~RIGHT_EDGE
+JUMP_SE5 = STEP_SE5 & FULL_BOARD >> 8 & ~RIGHT_EDGE
+# The steps and jumps of the southward (black men's) and northward (white
+# men's) directions for BitBoard, as (source mask, shift) pairs and as
+# (source mask, shift to the captured piece, shift to the landing square)
+# triples. Shifts are unsigned: southward ones raise square indices and
+# northward ones lower them.
+SOUTH_STEPS = ((STEP_S4, 4), (STEP_SE5, 5), (STEP_SW3, 3))
+NORTH_STEPS = ((STEP_N4, 4), (STEP_NW5, 5), (STEP_NE3, 3))
+SOUTH_JUMPS = ((JUMP_SE4, 4, 9), (JUMP_SE5, 5, 9),
+               (JUMP_SW4, 4, 7), (JUMP_SW3, 3, 7))
+NORTH_JUMPS = ((JUMP_NW4, 4, 9), (JUMP_NW5, 5, 9),
+               (JUMP_NE4, 4, 7), (JUMP_NE3, 3, 7))
+# The opposite of each direction
+OPPOSITE_DIR = {"NW": "SE", "NE": "SW", "SW": "NE", "SE": "NW"}
+# Directions a man may move in; kings may move in all four
+BLACK_DIRS = ("SE", "SW")
+WHITE_DIRS = ("NE", "NW")
+
 
-def play_game(game):
+def play_game(game, black_player=None, white_player=None):
     """Run the checkers game
 
-    This is the entry function that runs the entire game.
+    This is the entry function that runs the entire game. The black and
+    white players are computer players, such as AIPlayer instances, or None
+    for a human player entering moves at the console.
     """
+    players = {True: black_player, False: white_player}
     game.show_rules()
-    game.get_player_names()
+    game.get_player_names(
+        [color for color, player in (('black', black_player),
+                                     ('white', white_player)) if not player])
+    if black_player:
+        game.black_name = black_player.name
+    if white_player:
+        game.white_name = white_player.name
     while True:
         curr_player = game.black_name if game.blacks_turn else \
             game.white_name
+        player = players[game.blacks_turn]
         # Prompt for player input
-        move = game.get_player_move_from()
+        move = player.get_player_move_from(game) if player else \
+            game.get_player_move_from()
         if move == 'r':
+            game.resign()
             print("{} has resigned. Game over!".format(curr_player))
             break
         elif move == 'd':
             game.move_msg = "{} is offering a draw.".format(curr_player)
-            if game.draw_accepted():
+            opponent = players[not game.blacks_turn]
+            if opponent.draw_accepted(game) if opponent else \
+                    game.draw_accepted():
+                game.agree_draw()
                 print("Game ended in a draw!")
                 break
             else:
@@ -59,18 +394,17 @@ def play_game(game):
         if game.validate_pick(square):
             # Prompt player for square to move to
             while True:
-                move_to = game.get_player_move_to()
+                move_to = player.get_player_move_to(game) if player else \
+                    game.get_player_move_to()
                 # Convert it to internal representation
                 square = int(move_to) - 1
                 # Validate that the selected square is legal to move to
                 if game.validate_move_to(square):
-                    game.board.move_piece_to(game, square)
+                    game.move_piece_to(square)
                 else:
                     continue
                 if game.turn_is_complete(square):
                     # It was a simple move or no more jumps are available
-                    game.game_piece_to_move = None
-                    game.must_jump = False
                     break
                 # More jumps are available, which must be taken
                 game.game_piece_to_move = square
@@ -79,9 +413,12 @@ def play_game(game):
             # Return to the top of the game loop to prompt the player again
             continue
         # The current player's turn has completed. Switch turns.
-        game.switch_turns()
-        if game.has_player_lost():
+        game.end_turn()
+        if game.is_over:
             game.board.display_board(game)
+            if game.result == DRAW:
+                print("Game ended in a draw by {}!".format(game.termination))
+                break
             winner = game.white_name if game.blacks_turn else game.black_name
             print("Congratulations {}! You have won.".format(winner))
             break
@@ -89,138 +426,58 @@ def play_game(game):
     print("Good bye!")
 
 
-class Checkers:
-    """Two-player checkers game
+class IllegalMoveError(ValueError):
+    """Raised when a move is not legal in the current game position"""
+
+
+class Game:
+    """Two-player checkers game state and rules, without any I/O
 
     Two players, the first one with dark, the second with light pieces.
+    Complete moves are played with apply_move(), while the methods from
+    validate_pick() to end_turn() play a move one hop at a time, the way a
+    player enters it. Once the game is over, result holds the outcome.
+    The game is drawn when a position occurs for the repetitions-th time
+    or after max_plies moves, if these are given, and termination then
+    tells which of these rules ended it.
     """
 
-    def __init__(self, player_black='Peter', player_white='Amanda'):
-        """Construct Checkers instance"""
+    __slots__ = ("black_name", "white_name", "board", "move_msg",
+                 "game_piece_to_move", "must_jump", "history", "start_fen",
+                 "result", "max_plies", "repetitions", "termination",
+                 "_seen", "_hops", "_captures")
+
+    def __init__(self, player_black='Peter', player_white='Amanda',
+                 max_plies=None, repetitions=None):
+        """Construct Game instance"""
         self.black_name = player_black
         self.white_name = player_white
         self.board = Board()
-        self.blacks_turn = True
         self.move_msg = ''
         self.game_piece_to_move = None
         self.must_jump = False
+        # Moves played so far, the position before the first of them in FEN,
+        # and the result once the game is over
+        self.history = []
+        self.start_fen = None
+        self.result = None
+        self.max_plies = max_plies
+        self.repetitions = repetitions
+        self.termination = None
+        # Number of times each position occurred, by Zobrist hash
+        self._seen = None
+        # Squares visited and captured by the move entered hop by hop
+        self._hops = []
+        self._captures = []
 
-    @staticmethod
-    def show_rules():
-        """Display game rules"""
-        rules = """
-Welcome to this awesome checkers game!
-
-
-The game rules are as follows:
-
-Two players participate in the game. Each has a starting set of 12
-game pieces (men), one set white and the other black. Each player's
-men are initially placed on the 12 dark squares of the board
-closest to them. The player with the black pieces starts the game,
-then the players take turns moving one piece each turn.
-
-There are two types of moves, a simple move and a jump. for both
-types of moves an uncrowned piece (man) may only move forward,
-while a crowned piece (king) may move in any diagonal direction.
-Initially all pieces are uncrowned. A piece that reaches the edge
-row, aka kings row, (moving in the forward direction) becomes crowned
-(promoted to a king).
-
-As simple move consists of sliding a piece one square diagonally
-to an adjacent dark square. After a simple move the player's turn
-ends.
-
-A jump is a move from a square diagonally adjacent to an opponent's
-piece to an empty dark square immediately beyond it, in the same
-direction (jumping over the opponent's piece). A jumped piece is
-considered captured, and is removed from the board. If after a
-jump another jump is possible with the same piece, it must be
-taken. If more than one multiple-jump move is possible, the
-player may choose among them.
-
-Jumping is mandatory. If both types of moves are possible, a jump
-must be taken. A player must continue the jump sequence until no
-further jump is available, at which point the turn ends. Jumping
-into the kings row always ends the turn.
-
-A player wins by capturing all of the opponent's pieces or by
-leaving the opponent with no legal move. The game may also end
-in a draw if neither side can force a win, and one side is
-offering a draw which the opponent accepts.
-        """
-        print(rules)
-
-    def get_player_names(self):
-        """Prompt for player names"""
-        for color in ('black', 'white'):
-            prompt = "Player for {}, please type in your name: ".format(color)
-            while True:
-                name = input(prompt)
-                if name:
-                    if color == 'black':
-                        self.black_name = name
-                    else:
-                        self.white_name = name
-                    print("Thank you!")
-                    break
-
-    def draw_accepted(self):
-        """Get opponent's answer to draw offer and return it
-
-        Return True if draw was accepted, otherwise return False.
-        """
-        self.board.display_board(self)
-        opponent = self.white_name if self.blacks_turn else self.black_name
-        print("{}, ".format(opponent) + self.move_msg + "\n")
-        prompt = "Enter 'y' to accept the draw or anything else" +\
-            " to reject it.\n -> "
-        return input(prompt).lower() == "y"
-
-    def get_player_move_from(self):
-        """Get player's next move
-
-        Display the game board then print any error message from previous
-        input validation and prompt for player input. Accept only 'r', 'd'
-        or 1-32 input, otherwise reprompt. Return accepted input, and reset
-        error message to empty string.
-        """
-        valid_moves = [str(i) for i in range(1, 33)]
-        valid_moves.extend(['r', 'd'])
-        curr_player = self.black_name if self.blacks_turn else self.white_name
-        while True:
-            self.board.display_board(self)
-            print("{}, it is your turn.".format(curr_player))
-            print(self.move_msg)
-            prompt = "What is your next move?\n" +\
-                "(r)esign | (d)raw | 1 - 32 to pick a piece to move -> "
-            move = input(prompt).lower()
-            if move in valid_moves:
-                self.move_msg = ''
-                return move
-            self.move_msg = 'Invalid entry. Try again!'
-
-    def get_player_move_to(self):
-        """Get player's selection of where to move picked-up piece.
+    @property
+    def blacks_turn(self):
+        """True if it is black's turn, as kept by the board"""
+        return self.board.blacks_turn
 
-        Display the game board then print any error message from previous
-        input validation and prompt for player input. Accept only a square
-        (1-32) as input, otherwise reprompt. Return accepted input.
-        """
-        valid_moves = [str(i) for i in range(1, 33)]
-        curr_player = self.black_name if self.blacks_turn else self.white_name
-        input_message = ''
-        while True:
-            self.board.display_board(self)
-            print("{}, it is your turn.".format(curr_player))
-            print(self.move_msg)
-            print(input_message)
-            prompt = "Where do you want to move this piece?\n" +\
-                "1 - 32 to pick a square to move to -> "
-            move = input(prompt).lower()
-            if move in valid_moves:
-                return move
-            input_message = 'Invalid entry. Try again!'
+    @blacks_turn.setter
+    def blacks_turn(self, blacks_turn):
+        self.board.blacks_turn = blacks_turn
 
     def get_available_moves(self):
         """Return all available moves for current player
@@ -228,17 +485,16 @@ offering a draw which the opponent accepts.
         The return value is a list of movable pieces, whose elements are tuples
         of the form (piece_index<int>, can_piece_jump?<boolean>).
         """
-        moves = []
-        active_pieces = ("bm", "bk") if self.blacks_turn else ("wm", "wk")
-        opponents = ("wm", "wk") if self.blacks_turn else ("bm", "bk")
-        for idx, piece in enumerate(self.board.squares):
-            # Check only squares with pieces belonging to the current player
-            if piece in active_pieces:
-                if self.board.valid_jumps(idx, opponents):
-                    moves.append((idx, True))
-                elif self.board.valid_moves(idx):
-                    moves.append((idx, False))
-        return moves
+        # The board keeps the movable pieces of both sides up to date
+        return self.board.get_movable(self.blacks_turn)
+
+    def get_legal_moves(self):
+        """Return all complete legal moves for current player
+
+        The return value is a list of Move tuples, each holding the full path
+        of the moving piece and the squares of all pieces it captures.
+        """
+        return list(self.board.generate_moves())
 
     def square_is_empty_or_has_opponents_piece(self, square):
         """Check if square has no legal piece to move
@@ -247,9 +503,7 @@ offering a draw which the opponent accepts.
         message and return True. Otherwise reset message to empty string
         and return False.
         """
-        wrong_pieces = ("wm", "wk", "") if self.blacks_turn else \
-            ("bm", "bk", "")
-        if self.board.get_square(square) in wrong_pieces:
+        if self.board.side_of(square) is not self.blacks_turn:
             self.move_msg = "You don't have a piece on that square to move."
             return True
         self.move_msg = ""
@@ -316,9 +570,7 @@ offering a draw which the opponent accepts.
         """
         # Jump must be taken
         if self.must_jump:
-            opponents = ("wm", "wk") if self.blacks_turn else ("bm", "bk")
-            if square in self.board.valid_jumps(self.game_piece_to_move,
-                                                opponents):
+            if square in self.board.valid_jumps(self.game_piece_to_move):
                 return True
             else:
                 self.move_msg = "The piece from {} must jump.".format(
@@ -345,8 +597,7 @@ offering a draw which the opponent accepts.
         if not self.must_jump:
             return True
         # After a jump check if a further jump is available
-        moves = self.get_available_moves()
-        if tuple((square, True)) in moves:
+        if self.board.can_jump(square):
             self.move_msg = "The piece from {} must jump.".format(square+1)
             return False
         else:
@@ -359,13 +610,8 @@ offering a draw which the opponent accepts.
         the remaining pieces have available moves or jumps. Otherwise
         return False.
         """
-        board_stats = self.board.get_board_stats()
-        # Does player have no piece left on the board?
-        if (self.blacks_turn and board_stats["bm"]+board_stats["bk"] == 0 or
-            not self.blacks_turn and board_stats["wm"]+board_stats["wk"] == 0):
-            return True
-        # Does the current player has any piece to play?
-        return not self.get_available_moves()
+        # A player with no piece left has no piece to play either
+        return not self.board.has_moves(self.blacks_turn)
 
     def switch_turns(self):
         """Switches to other player's turn"""
@@ -374,222 +620,3370 @@ offering a draw which the opponent accepts.
         self.game_piece_to_move = None
         self.must_jump = False
 
+    @property
+    def is_over(self):
+        """True if the game has ended"""
+        return self.result is not None
 
-class Board:
-    """Game board for checkers
+    def find_move(self, path):
+        """Return the legal Move following path, or None
 
-    The reachable squares on the board are numbered from 1 to 32, which are
-    represented in the self.squares[0-31] list containing string values.
-    Valid string values are those of the keys of the PIECE_DISP dictionary.
+        Path is a Move or a sequence of square indices (0-31), starting with
+        the square of the piece to move.
+        """
+        path = tuple(path.path if isinstance(path, Move) else path)
+        # Run the generator to its end, which restores the board, before
+        # returning a move
+        for move in list(self.board.generate_moves()):
+            if move.path == path:
+                return move
+        return None
 
-    The standard notation for the reachable squares on the board (1-32) is
-    used in the user interface, e.g. in displaying a player's move, and for
-    the player to specify a square on the board. The corresponding index
-    range (0-31) is used internal to the program.
+    def is_legal(self, path):
+        """Return True if the move following path is legal"""
+        return not self.is_over and self.find_move(path) is not None
 
-    The board is organized into eight rows (1-8), with four white and black
-    squares each. Odd rows start with a white square. For instance, row 3
-    starts with a white square, and contains reachable squares 9-12, which
-    are represented by the slice self.squares[8:12].
-    """
+    def apply_move(self, path):
+        """Play a complete move for the current player and pass the turn
 
-    def __init__(self):
-        """Construct game board"""
-        # 12 initial black men on squares 0-11
-        self.squares = ["bm" for _ in range(12)]
-        # 8 blank squares on 12-19
-        self.squares.extend(["" for _ in range(8)])
-        # 12 initial black men on squares 20-31
-        self.squares.extend(["wm" for _ in range(12)])
+        Path is a Move or a sequence of square indices (0-31), starting with
+        the square of the piece to move. Return the Move played. Raise
+        IllegalMoveError if the game is over or the move is not legal.
+        """
+        if self.is_over:
+            raise IllegalMoveError("the game is over")
+        move = self.find_move(path)
+        if move is None:
+            squares = path.path if isinstance(path, Move) else path
+            raise IllegalMoveError("illegal move: {}".format(
+                "-".join(str(square + 1) for square in squares)))
+        if not self.history:
+            self._start()
+        self.board.make_move(move)
+        self.move_msg = ''
+        self.game_piece_to_move = None
+        self.must_jump = False
+        self._record_move(move)
+        return move
 
-    def get_board_stats(self):
-        """Return stats of pieces and empty squares on the board"""
-        stats = dict.fromkeys(PIECE_DISP.keys(), 0)
-        for piece in self.squares:
-            stats[piece] += 1
-        return stats
+    def move_piece_to(self, square):
+        """Move the picked-up piece to square, one hop of a move
 
-    def get_square(self, index):
-        """Return the piece on the board by index
+        The square must have been validated with validate_move_to().
+        """
+        origin = self.game_piece_to_move
+        if not self._hops:
+            if not self.history:
+                self._start()
+            self._hops.append(origin)
+        if self.must_jump:
+            self._captures.append(CAPTURED_SQ[origin, square])
+        self._hops.append(square)
+        self.board.move_piece_to(self, square)
 
-        Valid index values are in the 0-31 range, the actual index range of the
-        self.squares list."""
-        return self.squares[index]
+    def end_turn(self):
+        """Complete the move entered hop by hop and pass the turn"""
+        move = Move(tuple(self._hops), tuple(self._captures))
+        self._hops = []
+        self._captures = []
+        self.switch_turns()
+        self._record_move(move)
 
-    def get_row(self, row):
-        """Return a string representing a board's row"""
-        empty_sq = WH_SQ + BOX["vb"]
-        first_idx = (row - 1) * 4
-        row_out = "".join([
-            PIECE_DISP[p] + BOX["vb"] +
-            empty_sq for p in self.squares[first_idx:first_idx+3]
-        ])
-        row_out += PIECE_DISP[self.squares[first_idx+3]]
-        if row % 2:
-            row_out = BOX["vb"] + empty_sq + row_out + BOX["vb"]
-        else:
-            row_out = BOX["vb"] + row_out + BOX["vb"] + empty_sq
-        # Reachable squares for the current row in Portable Draughts Notation
-        p_d_notation = "<{}-{}>".format(first_idx + 1, first_idx + 4)
-        return row_out + p_d_notation
-        # return row_out
+    def _start(self):
+        """Remember the position before the first move"""
+        self.start_fen = self.board.to_fen()
+        self._seen = {self.board.zobrist_hash: 1}
 
-    def jump_room_exists(self, square_idx, direction):
-        """Checks if there is room on the board to jump in given direction
+    def _record_move(self, move):
+        """Add move to the history and end the game if it is over"""
+        self.history.append(move)
+        if self.has_player_lost():
+            self._finish(WHITE_WINS if self.blacks_turn else BLACK_WINS)
+            return
+        key = self.board.zobrist_hash
+        seen = self._seen[key] = self._seen.get(key, 0) + 1
+        if self.repetitions and seen >= self.repetitions:
+            self._finish(DRAW, REPETITION)
+        elif self.max_plies is not None and \
+                len(self.history) >= self.max_plies:
+            self._finish(DRAW, PLY_LIMIT)
 
-        Diagonal direction (value: meaning) are as follows (internal square
-        representation - 0-31):
-        'NW': toward corner of board near square 0
-        'NE': toward corner of board near square 3
-        'SW': toward corner of board near square 28
-        'SE': toward corner of board near square 31
-        Returns True if there is an empty square diagonally two squares
-        away in the given direction, otherwise returns False.
+    def resign(self, black=None):
+        """End the game with a player resigning
+
+        Black resigns if black is True, white if it is False and by default
+        the current player.
         """
-        if direction == 'NW':
-            if square_idx >= 9 and square_idx % 4:
-                return self.get_square(square_idx-9) == ""
-            else:
-                return False
-        elif direction == 'NE':
-            if square_idx >= 8 and (square_idx+1) % 4:
-                return self.get_square(square_idx-7) == ""
-            else:
-                return False
-        elif direction == 'SW':
-            if square_idx <= 23 and square_idx % 4:
-                return self.get_square(square_idx+7) == ""
-            else:
-                return False
-        else:
-            if square_idx <= 22 and (square_idx+1) % 4:
-                return self.get_square(square_idx+9) == ""
-            else:
-                return False
+        if black is None:
+            black = self.blacks_turn
+        self._finish(WHITE_WINS if black else BLACK_WINS)
 
-    def valid_jumps(self, square, opponents):
-        """Find all legal jumps for the piece on square
+    def agree_draw(self):
+        """End the game in a draw"""
+        self._finish(DRAW)
 
-        Return the list of all legal jumps the piece on square.
-        """
-        jumps = []
-        if self.get_square(square) in ("bm", "bk", "wk"):
-            # "bm", "bk" or "wk" can move in southerly direction
-            # Can jump in SE direction?
-            if self.jump_room_exists(square, "SE"):
-                diag_offs = 4 if (square//4) % 2 else 5
-                if self.get_square(square+diag_offs) in opponents:
-                    # Jump offset in SE direction is 9
-                    jumps.append(square+9)  # Add available jump
-            # Can jump in SW direction?
-            if self.jump_room_exists(square, "SW"):
-                diag_offs = 3 if (square//4) % 2 else 4
-                if self.get_square(square+diag_offs) in opponents:
-                    # Jump offset in SW direction is 7
-                    jumps.append(square+7)  # Add available jump
-        if self.get_square(square) in ("bk", "wm", "wk"):
-            # "bk", "wm" or "wk" can move in northerly direction
-            # Can jump in NE direction?
-            if self.jump_room_exists(square, "NE"):
-                diag_offs = -4 if (square//4) % 2 else -3
-                if self.get_square(square+diag_offs) in opponents:
-                    # Jump offset in NE direction is -7
-                    jumps.append(square-7)  # Add available jump
-            # Can jump in NW direction?
-            if self.jump_room_exists(square, "NW"):
-                diag_offs = -5 if (square//4) % 2 else -4
-                if self.get_square(square+diag_offs) in opponents:
-                    # Jump offset in NW direction is -9
-                    jumps.append(square-9)  # Add available jump
-        return jumps
+    def _finish(self, result, termination=None):
+        """End the game with result, by the draw rule termination if any"""
+        self.result = result
+        self.termination = termination
 
-    def valid_moves(self, square):
-        """Find all legal simple moves for the piece on square
 
-        Return the list of all legal simple moves the piece on square.
-        """
-        moves = []
-        if self.get_square(square) in ("bm", "bk", "wk"):
-            # "bm", "bk" or "wk" can move in southerly direction
-            # Can move in SE direction?
-            if square <= 26 and square not in (3, 11, 19):
-                diag_offs = 4 if (square//4) % 2 else 5
-                if self.get_square(square+diag_offs) == "":
-                    moves.append(square+diag_offs)  # Add available move
-            # Can move in SW direction?
-            if square <= 27 and square not in (4, 12, 20):
-                diag_offs = 3 if (square//4) % 2 else 4
-                if self.get_square(square+diag_offs) == "":
-                    moves.append(square+diag_offs)  # Add available move
-        if self.get_square(square) in ("bk", "wm", "wk"):
-            # "bk", "wm" or "wk" can move in northerly direction
-            # Can move in NE direction?
-            if square >= 4 and square not in (11, 19, 27):
-                diag_offs = -4 if (square//4) % 2 else -3
-                if self.get_square(square+diag_offs) == "":
-                    moves.append(square+diag_offs)  # Add available move
-            # Can move in NW direction?
-            if square >= 5 and square not in (12, 20, 28):
-                diag_offs = -5 if (square//4) % 2 else -4
-                if self.get_square(square+diag_offs) == "":
-                    moves.append(square+diag_offs)  # Add available move
-        return moves
+class Checkers(Game):
+    """Two-player checkers game played at the console
 
-    def move_piece_to(self, game, square):
-        """Make the selected move
+    Extends the game with prompting the players and displaying the board.
+    """
 
-        Move the selected piece to the destination square, and crown it if
-        necessary. If it was a jump, remove the captured piece.
+    __slots__ = ()
 
-        NOTE: Jumping into the kings row ends the turn. This is enforced by
-        setting the must_jump instance attribute to False.
-        """
-        # Move the current player's piece
-        self.squares[square] = self.squares[game.game_piece_to_move]
-        self.squares[game.game_piece_to_move] = ""
-        # If current player's piece jumped, remove opponent's captured piece
-        if game.must_jump:
-            diag_jump_offs = {
-                -9: (-4, -5),  # NW diagonal offsets
-                -7: (-3, -4),  # NE diagonal offsets
-                7: (4, 3),  # SW diagonal offsets
-                9: (5, 4)  # SE diagonal offsets
-            }
-            jump_offs = square - game.game_piece_to_move
-            even_odd_row = (game.game_piece_to_move//4) % 2
-            captured_offs = diag_jump_offs[jump_offs][even_odd_row]
-            self.squares[game.game_piece_to_move+captured_offs] = ""
-        # Crown destination piece if appropriate
-        if game.blacks_turn:
-            if square > 27:
-                self.squares[square] = "bk"
-                # Jumping into the kings row ends the turn
-                game.must_jump = False
-        else:
-            if square < 4:
-                self.squares[square] = "wk"
-                # Jumping into the kings row ends the turn
-                game.must_jump = False
+    @staticmethod
+    def show_rules():
+        """Display game rules"""
+        rules = """
+Welcome to this awesome checkers game!
 
-    def display_board(self, game):
-        """Display game board with player names after clearing the screen"""
 
-        # Define elements for drawing the board
-        hbx3 = BOX["hb"] * 3
-        top = BOX["ul"] + (hbx3+BOX["nt"]) * 7 + hbx3 + BOX["ur"]
-        mid = BOX["wt"] + (hbx3+BOX["cc"]) * 7 + hbx3 + BOX["et"]
-        bot = BOX["ll"] + (hbx3+BOX["st"]) * 7 + hbx3 + BOX["lr"]
-        # Construct the board
-        board_view = top + "\n"
-        for row in range(1, 8):
-            board_view = board_view + self.get_row(row) + "\n" + mid + "\n"
-        board_view = board_view + self.get_row(8) + "\n" + bot
-        # Clear the screen and display the player names and board
-        os.system('clear')
-        print("Black: {}".format(game.black_name))
-        print(board_view)
-        print("White: {}\n".format(game.white_name))
+The game rules are as follows:
+
+Two players participate in the game. Each has a starting set of 12
+game pieces (men), one set white and the other black. Each player's
+men are initially placed on the 12 dark squares of the board
+closest to them. The player with the black pieces starts the game,
+then the players take turns moving one piece each turn.
+
+There are two types of moves, a simple move and a jump. for both
+types of moves an uncrowned piece (man) may only move forward,
+while a crowned piece (king) may move in any diagonal direction.
+Initially all pieces are uncrowned. A piece that reaches the edge
+row, aka kings row, (moving in the forward direction) becomes crowned
+(promoted to a king).
+
+As simple move consists of sliding a piece one square diagonally
+to an adjacent dark square. After a simple move the player's turn
+ends.
+
+A jump is a move from a square diagonally adjacent to an opponent's
+piece to an empty dark square immediately beyond it, in the same
+direction (jumping over the opponent's piece). A jumped piece is
+considered captured, and is removed from the board. If after a
+jump another jump is possible with the same piece, it must be
+taken. If more than one multiple-jump move is possible, the
+player may choose among them.
+
+Jumping is mandatory. If both types of moves are possible, a jump
+must be taken. A player must continue the jump sequence until no
+further jump is available, at which point the turn ends. Jumping
+into the kings row always ends the turn.
+
+A player wins by capturing all of the opponent's pieces or by
+leaving the opponent with no legal move. The game may also end
+in a draw if neither side can force a win, and one side is
+offering a draw which the opponent accepts.
+        """
+        print(rules)
+
+    def get_player_names(self, colors=('black', 'white')):
+        """Prompt for player names of the given colors"""
+        for color in colors:
+            prompt = "Player for {}, please type in your name: ".format(color)
+            while True:
+                name = input(prompt)
+                if name:
+                    if color == 'black':
+                        self.black_name = name
+                    else:
+                        self.white_name = name
+                    print("Thank you!")
+                    break
+
+    def draw_accepted(self):
+        """Get opponent's answer to draw offer and return it
+
+        Return True if draw was accepted, otherwise return False.
+        """
+        self.board.display_board(self)
+        opponent = self.white_name if self.blacks_turn else self.black_name
+        print("{}, ".format(opponent) + self.move_msg + "\n")
+        prompt = "Enter 'y' to accept the draw or anything else" +\
+            " to reject it.\n -> "
+        return input(prompt).lower() == "y"
+
+    def get_player_move_from(self):
+        """Get player's next move
+
+        Display the game board then print any error message from previous
+        input validation and prompt for player input. Accept only 'r', 'd'
+        or 1-32 input, otherwise reprompt. Return accepted input, and reset
+        error message to empty string.
+        """
+        valid_moves = [str(i) for i in range(1, 33)]
+        valid_moves.extend(['r', 'd'])
+        curr_player = self.black_name if self.blacks_turn else self.white_name
+        while True:
+            self.board.display_board(self)
+            print("{}, it is your turn.".format(curr_player))
+            print(self.move_msg)
+            prompt = "What is your next move?\n" +\
+                "(r)esign | (d)raw | 1 - 32 to pick a piece to move -> "
+            move = input(prompt).lower()
+            if move in valid_moves:
+                self.move_msg = ''
+                return move
+            self.move_msg = 'Invalid entry. Try again!'
+
+    def get_player_move_to(self):
+        """Get player's selection of where to move picked-up piece.
+
+        Display the game board then print any error message from previous
+        input validation and prompt for player input. Accept only a square
+        (1-32) as input, otherwise reprompt. Return accepted input.
+        """
+        valid_moves = [str(i) for i in range(1, 33)]
+        curr_player = self.black_name if self.blacks_turn else self.white_name
+        input_message = ''
+        while True:
+            self.board.display_board(self)
+            print("{}, it is your turn.".format(curr_player))
+            print(self.move_msg)
+            print(input_message)
+            prompt = "Where do you want to move this piece?\n" +\
+                "1 - 32 to pick a square to move to -> "
+            move = input(prompt).lower()
+            if move in valid_moves:
+                return move
+            input_message = 'Invalid entry. Try again!'
+
+
+class BoardStats(Mapping):
+    """Read-only view of the piece counts of a Board, by piece string"""
+
+    __slots__ = ("_board",)
+
+    def __init__(self, board):
+        """Construct view of the counts of board"""
+        self._board = board
+
+    def __getitem__(self, piece):
+        return self._board.piece_counts[PIECE_CODES[piece]]
+
+    def __iter__(self):
+        return iter(PIECES)
+
+    def __len__(self):
+        return len(PIECES)
+
+    def __repr__(self):
+        return "BoardStats({})".format(dict(self))
+
+
+class Board:
+    """Game board for checkers
+
+    The reachable squares on the board are numbered from 1 to 32, which are
+    represented in the self.squares[0-31] tuple containing string values.
+    Valid string values are those of the keys of the PIECE_DISP dictionary.
+    The tuple is a snapshot: squares are changed with set_square(), or all
+    at once by assigning self.squares. Internally the board keeps the
+    small integer code of each piece (see PIECES) in a 32-byte bytearray.
+
+    The standard notation for the reachable squares on the board (1-32) is
+    used in the user interface, e.g. in displaying a player's move, and for
+    the player to specify a square on the board. The corresponding index
+    range (0-31) is used internal to the program.
+
+    The board is organized into eight rows (1-8), with four white and black
+    squares each. Odd rows start with a white square. For instance, row 3
+    starts with a white square, and contains reachable squares 9-12, which
+    are represented by the slice self.squares[8:12].
+    """
+
+    __slots__ = ("_cells", "_counts", "_blacks_turn", "_hash",
+                 "_undo_stack", "_movable", "_jumping", "_stats")
+
+    def __init__(self):
+        """Construct game board"""
+        self._blacks_turn = True
+        self._set_cells(INITIAL_CELLS)
+
+    @property
+    def squares(self):
+        """Tuple of the pieces on the board, indexed by square
+
+        The tuple is a snapshot, so single squares must be changed through
+        set_square(). Assigning a sequence of 32 pieces sets up the whole
+        board.
+        """
+        return tuple(PIECES[code] for code in self._cells)
+
+    @squares.setter
+    def squares(self, squares):
+        try:
+            cells = bytes(PIECE_CODES[piece] for piece in squares)
+        except KeyError as err:
+            raise ValueError("invalid piece: {!r}".format(err.args[0])) \
+                from None
+        if len(cells) != 32:
+            raise ValueError("a board has 32 squares")
+        self._set_cells(cells)
+
+    def _set_cells(self, cells):
+        """Set up the board from 32 piece codes and rebuild derived state"""
+        self._cells = bytearray(cells)
+        # Running count of each piece type and of empty squares, by code
+        self._counts = bytearray(len(PIECES))
+        for code in self._cells:
+            self._counts[code] += 1
+        # Undo records of the moves made with make_move()
+        self._undo_stack = []
+        self._hash = 0 if self._blacks_turn else ZOBRIST_WHITE_TO_MOVE
+        for square, code in enumerate(self._cells):
+            self._hash ^= ZOBRIST_KEYS[code][square]
+        # Bitboards of the movable pieces and of the pieces that can jump,
+        # indexed by side (blacks_turn)
+        self._movable = [0, 0]
+        self._jumping = [0, 0]
+        self._refresh_mobility(range(32))
+        # Mapping returned by get_board_stats(), created on first use
+        self._stats = None
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Return board set up from a position in PDN FEN notation
+
+        The notation gives the side to move, then the white and the black
+        pieces by square number (1-32), e.g. 'W:W18,K26:B1-4,K32'. Kings
+        are prefixed with 'K' and runs of squares may be given as ranges.
+        Raise ValueError if the string is not a valid position.
+        """
+        fields = fen.strip().strip('"').rstrip(".").split(":")
+        if len(fields) != 3 or fields[0].upper() not in ("B", "W"):
+            raise ValueError("invalid FEN position: {!r}".format(fen))
+        squares = ["" for _ in range(32)]
+        for field in fields[1:]:
+            color = field[:1].upper()
+            if color not in ("B", "W"):
+                raise ValueError("invalid FEN position: {!r}".format(fen))
+            for token in field[1:].split(","):
+                token = token.strip().upper()
+                if not token:
+                    continue
+                kind = "k" if token.startswith("K") else "m"
+                first, _, last = token.lstrip("K").partition("-")
+                try:
+                    numbers = range(int(first), int(last or first) + 1)
+                except ValueError:
+                    raise ValueError(
+                        "invalid FEN position: {!r}".format(fen)) from None
+                for number in numbers:
+                    if not 1 <= number <= 32:
+                        raise ValueError(
+                            "invalid FEN square: {}".format(number))
+                    squares[number - 1] = color.lower() + kind
+        board = cls()
+        board.blacks_turn = fields[0].upper() == "B"
+        board.squares = squares
+        return board
+
+    def to_fen(self):
+        """Return the position in PDN FEN notation"""
+        fields = ["B" if self._blacks_turn else "W"]
+        for side in (False, True):
+            fields.append(("B" if side else "W") + ",".join(
+                ("K" if code in KING_CODES else "") + str(square + 1)
+                for square, code in enumerate(self._cells)
+                if PIECE_SIDE[code] is side))
+        return ":".join(fields)
+
+    def encode(self):
+        """Return the position and side to move packed into 13 bytes"""
+        bits = BitBoard.from_board(self)
+        return POSITION_STRUCT.pack(bits.black, bits.white, bits.kings,
+                                    self._blacks_turn)
+
+    @classmethod
+    def decode(cls, data):
+        """Return board set up from a position packed by encode()"""
+        black, white, kings, blacks_turn = POSITION_STRUCT.unpack(data)
+        board = cls()
+        board.blacks_turn = bool(blacks_turn)
+        board.squares = BitBoard(black, white, kings).squares
+        return board
+
+    @property
+    def blacks_turn(self):
+        """True if it is black's turn to move, otherwise False"""
+        return self._blacks_turn
+
+    @blacks_turn.setter
+    def blacks_turn(self, blacks_turn):
+        if blacks_turn != self._blacks_turn:
+            self._hash ^= ZOBRIST_WHITE_TO_MOVE
+        self._blacks_turn = blacks_turn
+
+    @property
+    def zobrist_hash(self):
+        """64-bit Zobrist hash of the position and the side to move"""
+        return self._hash
+
+    @property
+    def movable_pieces(self):
+        """Movable pieces of each side keyed by blacks_turn
+
+        Each side maps the square of a movable piece to whether that piece
+        can jump. The dicts are built on every access from the bitboards
+        the board keeps up to date.
+        """
+        return {side: dict(self.get_movable(side)) for side in (True, False)}
+
+    def get_movable(self, blacks_turn):
+        """Return the sorted (square, can_jump) pairs of a side's movable
+        pieces"""
+        jumping = self._jumping[blacks_turn]
+        return [(square, bool(jumping >> square & 1))
+                for square in iter_bits(self._movable[blacks_turn])]
+
+    def has_moves(self, blacks_turn):
+        """Return True if the side has a piece that can move or jump"""
+        return self._movable[blacks_turn] != 0
+
+    def has_jumps(self, blacks_turn):
+        """Return True if the side has a piece that can jump"""
+        return self._jumping[blacks_turn] != 0
+
+    def can_jump(self, square):
+        """Return True if the piece on square can jump"""
+        return bool((self._jumping[0] | self._jumping[1]) >> square & 1)
+
+    @classmethod
+    def from_codes(cls, codes, blacks_turn=True):
+        """Return board set up from 32 piece codes (see PIECES)"""
+        board = cls.__new__(cls)
+        board._blacks_turn = blacks_turn
+        board._set_cells(codes)
+        return board
+
+    def piece_codes(self):
+        """Return the piece codes of the squares as bytes"""
+        return bytes(self._cells)
+
+    def side_of(self, square):
+        """Return the side (blacks_turn) of the piece on square, or None"""
+        return PIECE_SIDE[self._cells[square]]
+
+    def set_square(self, index, piece):
+        """Place piece (or "" to empty it) on the square by index"""
+        code = PIECE_CODES[piece]
+        old_code = self._cells[index]
+        self._counts[old_code] -= 1
+        self._counts[code] += 1
+        self._hash ^= ZOBRIST_KEYS[old_code][index] ^ \
+            ZOBRIST_KEYS[code][index]
+        self._cells[index] = code
+        self._refresh_mobility((index,))
+
+    def _refresh_mobility(self, changed):
+        """Update the movable pieces near the changed squares
+
+        Only the pieces on the changed squares and one or two diagonal steps
+        away from them can gain or lose a move, so the rest of the board is
+        not looked at.
+        """
+        cells = self._cells
+        movable = self._movable
+        jumping = self._jumping
+        refresh = set()
+        cleared = 0
+        for square in changed:
+            refresh.update(AFFECTED_SQ[square])
+            cleared |= AFFECTED_BITS[square]
+        kept = ~cleared
+        movable[0] &= kept
+        movable[1] &= kept
+        jumping[0] &= kept
+        jumping[1] &= kept
+        for square in refresh:
+            code = cells[square]
+            if not code:
+                continue
+            blacks_turn = PIECE_SIDE[code]
+            opponents = SIDE_PIECES[not blacks_turn]
+            for neighbor, landing in PIECE_STEPS[code][square]:
+                target = cells[neighbor]
+                if not target:
+                    movable[blacks_turn] |= 1 << square
+                elif (landing is not None and target in opponents and
+                        not cells[landing]):
+                    movable[blacks_turn] |= 1 << square
+                    jumping[blacks_turn] |= 1 << square
+                    break
+
+    def get_board_stats(self):
+        """Return stats of pieces and empty squares on the board
+
+        The stats are a read-only BoardStats mapping of piece string to
+        count. It is created once and then follows the board as pieces
+        move, so getting and reading it takes constant time.
+        """
+        if self._stats is None:
+            self._stats = BoardStats(self)
+        return self._stats
+
+    @property
+    def piece_counts(self):
+        """Count of each piece type and of empty squares, by piece code
+
+        This is the board's own running count, to be treated as read-only.
+        """
+        return self._counts
+
+    def get_square(self, index):
+        """Return the piece on the board by index
+
+        Valid index values are in the 0-31 range, the actual index range of the
+        self.squares tuple."""
+        return PIECES[self._cells[index]]
+
+    def get_row(self, row):
+        """Return a string representing a board's row"""
+        empty_sq = WH_SQ + BOX["vb"]
+        first_idx = (row - 1) * 4
+        squares = self.squares
+        row_out = "".join([
+            PIECE_DISP[p] + BOX["vb"] +
+            empty_sq for p in squares[first_idx:first_idx+3]
+        ])
+        row_out += PIECE_DISP[squares[first_idx+3]]
+        if row % 2:
+            row_out = BOX["vb"] + empty_sq + row_out + BOX["vb"]
+        else:
+            row_out = BOX["vb"] + row_out + BOX["vb"] + empty_sq
+        # Reachable squares for the current row in Portable Draughts Notation
+        p_d_notation = "<{}-{}>".format(first_idx + 1, first_idx + 4)
+        return row_out + p_d_notation
+        # return row_out
+
+    def jump_room_exists(self, square_idx, direction):
+        """Checks if there is room on the board to jump in given direction
+
+        Diagonal direction (value: meaning) are as follows (internal square
+        representation - 0-31):
+        'NW': toward corner of board near square 0
+        'NE': toward corner of board near square 3
+        'SW': toward corner of board near square 28
+        'SE': toward corner of board near square 31
+        Returns True if there is an empty square diagonally two squares
+        away in the given direction, otherwise returns False.
+        """
+        landing = JUMP_SQ[direction][square_idx]
+        return landing is not None and self._cells[landing] == EMPTY
+
+    def valid_jumps(self, square, opponents=None):
+        """Find all legal jumps for the piece on square
+
+        Opponents are the codes of the pieces that may be jumped, by
+        default those of the other side. Return the list of all legal
+        jumps the piece on square.
+        """
+        cells = self._cells
+        code = cells[square]
+        if opponents is None:
+            opponents = SIDE_PIECES[not PIECE_SIDE[code]]
+        return [landing for over, landing in PIECE_STEPS[code][square]
+                if landing is not None and cells[over] in opponents and
+                not cells[landing]]
+
+    def valid_moves(self, square):
+        """Find all legal simple moves for the piece on square
+
+        Return the list of all legal simple moves the piece on square.
+        """
+        cells = self._cells
+        return [neighbor for neighbor, _ in PIECE_STEPS[cells[square]][square]
+                if not cells[neighbor]]
+
+    def generate_moves(self, blacks_turn=None):
+        """Yield every complete legal move of a side as a Move
+
+        The side defaults to the side to move on this board.
+
+        Jumps are mandatory, so simple moves are only yielded if no piece
+        of the side can jump. Multi-jumps are followed to their end by a
+        depth-first walk, which temporarily updates this board in place
+        instead of copying it. The board must not be changed while the
+        generator is active.
+        """
+        if blacks_turn is None:
+            blacks_turn = self._blacks_turn
+        cells = self._cells
+        jumping = self._jumping[blacks_turn]
+        if jumping:
+            opponents = SIDE_PIECES[not blacks_turn]
+            kings_row = KINGS_ROW[blacks_turn]
+            for square in iter_bits(jumping):
+                code = cells[square]
+                # Lift the jumping piece, so that it may pass its origin
+                cells[square] = EMPTY
+                try:
+                    yield from self._jump_sequences(
+                        code, [square], [], opponents, kings_row)
+                finally:
+                    cells[square] = code
+            return
+        for square in iter_bits(self._movable[blacks_turn]):
+            for neighbor, _ in PIECE_STEPS[cells[square]][square]:
+                if not cells[neighbor]:
+                    yield Move((square, neighbor), ())
+
+    def _jump_sequences(self, code, path, captures, opponents, kings_row):
+        """Yield all jump sequences continuing path
+
+        The squares of captured pieces are emptied while the walk is below
+        them, and restored on the way back up.
+        """
+        cells = self._cells
+        square = path[-1]
+        extended = False
+        for over, landing in PIECE_STEPS[code][square]:
+            if (landing is None or cells[over] not in opponents or
+                    cells[landing]):
+                continue
+            extended = True
+            captured = cells[over]
+            cells[over] = EMPTY
+            path.append(landing)
+            captures.append(over)
+            try:
+                if landing in kings_row:
+                    # Jumping into the kings row ends the turn
+                    yield Move(tuple(path), tuple(captures))
+                else:
+                    yield from self._jump_sequences(
+                        code, path, captures, opponents, kings_row)
+            finally:
+                path.pop()
+                captures.pop()
+                cells[over] = captured
+        if not extended and captures:
+            yield Move(tuple(path), tuple(captures))
+
+    def move_piece_to(self, game, square):
+        """Make the selected move
+
+        Move the selected piece to the destination square, and crown it if
+        necessary. If it was a jump, remove the captured piece.
+
+        NOTE: Jumping into the kings row ends the turn. This is enforced by
+        setting the must_jump instance attribute to False.
+        """
+        cells = self._cells
+        origin = game.game_piece_to_move
+        changed = [origin, square]
+        # Move the current player's piece
+        code = cells[origin]
+        cells[square] = code
+        cells[origin] = EMPTY
+        self._hash ^= ZOBRIST_KEYS[code][origin] ^ ZOBRIST_KEYS[code][square]
+        # If current player's piece jumped, remove opponent's captured piece
+        counts = self._counts
+        if game.must_jump:
+            captured = CAPTURED_SQ[origin, square]
+            counts[cells[captured]] -= 1
+            counts[EMPTY] += 1
+            self._hash ^= ZOBRIST_KEYS[cells[captured]][captured]
+            cells[captured] = EMPTY
+            changed.append(captured)
+        # Crown destination piece if appropriate
+        if square in KINGS_ROW[game.blacks_turn]:
+            crowned = CROWNS.get(code, code)
+            counts[code] -= 1
+            counts[crowned] += 1
+            self._hash ^= ZOBRIST_KEYS[code][square] ^ \
+                ZOBRIST_KEYS[crowned][square]
+            cells[square] = crowned
+            # Jumping into the kings row ends the turn
+            game.must_jump = False
+        self._refresh_mobility(changed)
+
+    def make_move(self, move):
+        """Make a complete move, such as one yielded by generate_moves()
+
+        Move the piece along move.path, remove the pieces on the squares in
+        move.captures, crown the piece if it ends in the kings row and pass
+        the turn to the other side. The move is not validated. It can be
+        taken back with unmake_move().
+        """
+        cells = self._cells
+        counts = self._counts
+        origin, dest = move.path[0], move.path[-1]
+        code = cells[origin]
+        captured = bytes(cells[square] for square in move.captures)
+        # Undo record: everything needed to restore the squares and hash
+        self._undo_stack.append(
+            (origin, dest, code, move.captures, captured, self._hash))
+        zhash = self._hash ^ ZOBRIST_WHITE_TO_MOVE ^ \
+            ZOBRIST_KEYS[code][origin]
+        cells[origin] = EMPTY
+        for square, captured_code in zip(move.captures, captured):
+            cells[square] = EMPTY
+            counts[captured_code] -= 1
+            zhash ^= ZOBRIST_KEYS[captured_code][square]
+        counts[EMPTY] += len(captured)
+        if code in CROWNS and dest in KINGS_ROW[code == BLACK_MAN]:
+            counts[code] -= 1
+            code = CROWNS[code]
+            counts[code] += 1
+        cells[dest] = code
+        self._hash = zhash ^ ZOBRIST_KEYS[code][dest]
+        self._blacks_turn = not self._blacks_turn
+        self._refresh_mobility((origin, dest) + move.captures)
+
+    def unmake_move(self):
+        """Take back the last move made with make_move()
+
+        Raise IndexError if there is no move to take back.
+        """
+        origin, dest, code, captures, captured, zhash = \
+            self._undo_stack.pop()
+        cells = self._cells
+        counts = self._counts
+        if cells[dest] != code:
+            # The piece was crowned by the move
+            counts[cells[dest]] -= 1
+            counts[code] += 1
+        cells[dest] = EMPTY
+        cells[origin] = code
+        for square, captured_code in zip(captures, captured):
+            cells[square] = captured_code
+            counts[captured_code] += 1
+        counts[EMPTY] -= len(captured)
+        self._hash = zhash
+        self._blacks_turn = not self._blacks_turn
+        self._refresh_mobility((origin, dest) + captures)
+
+    def display_board(self, game):
+        """Display game board with player names after clearing the screen"""
+        RENDERER.draw(self, game)
+
+
+class BoardRenderer:
+    """Console renderer of the game board with player names
+
+    The board frame is built once and row strings are cached by their
+    pieces. On a terminal the screen is cleared with ANSI escape sequences,
+    and once the board is on screen only the rows with changed squares are
+    rewritten. Rows are the unit of redrawing because the piece glyphs may
+    be wider than one column in some fonts. A terminal too small for the
+    board and the prompts below it scrolls, which moves the board, so it
+    gets the whole board after clearing the screen on every draw, as do
+    streams other than terminals, e.g. files or pipes, without clearing.
+    """
+
+    # Screen line of the black player's name, row 1 of the board is two
+    # lines below it, and prompts start below the white player's name
+    FIRST_LINE = 1
+    PROMPT_LINE = FIRST_LINE + 20
+    # Screen lines taken by the messages and prompts of a turn, including
+    # the line the cursor moves to after the player's answer
+    PROMPT_LINES = 6
+
+    def __init__(self, stream=None):
+        """Construct renderer writing to stream (default: sys.stdout)"""
+        self.stream = stream
+        self._rows = {}
+        # (player names, squares) currently on the terminal screen
+        self._screen = None
+
+    def get_row(self, board, row):
+        """Return the string of a board's row (1-8), cached by its pieces"""
+        first_idx = (row - 1) * 4
+        key = (row, tuple(board.squares[first_idx:first_idx+4]))
+        row_out = self._rows.get(key)
+        if row_out is None:
+            row_out = self._rows[key] = board.get_row(row)
+        return row_out
+
+    def draw(self, board, game):
+        """Draw board and player names"""
+        stream = self.stream or sys.stdout
+        names = (game.black_name, game.white_name)
+        squares = tuple(board.squares)
+        if not stream.isatty():
+            self._screen = None
+            stream.write(self._full_view(board, names))
+            return
+        if not self._fits(stream):
+            self._screen = None
+            stream.write(ANSI_CLEAR + self._full_view(board, names))
+            stream.flush()
+            return
+        if self._screen is None or self._screen[0] != names:
+            # Prompts start where the cursor is left, which is saved to
+            # return to on the next draw
+            out = [ANSI_CLEAR, self._full_view(board, names),
+                   ANSI_SAVE_CURSOR]
+        else:
+            out = []
+            drawn = self._screen[1]
+            for row in range(1, 9):
+                first_idx = (row - 1) * 4
+                if squares[first_idx:first_idx+4] != \
+                        drawn[first_idx:first_idx+4]:
+                    out.append(ANSI_MOVE_TO.format(
+                        self.FIRST_LINE + row*2, 1))
+                    out.append(self.get_row(board, row) + ANSI_CLEAR_LINE)
+            # Clear the messages and prompts of the previous turn
+            out.append(ANSI_RESTORE_CURSOR)
+            out.append(ANSI_CLEAR_BELOW)
+        self._screen = (names, squares)
+        stream.write("".join(out))
+        stream.flush()
+
+    def _fits(self, stream):
+        """Return True if the board and prompts fit on the terminal screen"""
+        try:
+            lines = os.get_terminal_size(stream.fileno()).lines
+        except (AttributeError, OSError, ValueError):
+            return False
+        return lines >= self.PROMPT_LINE + self.PROMPT_LINES - 1
+
+    def _full_view(self, board, names):
+        """Return the text of the whole board with player names"""
+        lines = ["Black: {}".format(names[0]), BOARD_TOP]
+        for row in range(1, 9):
+            lines.append(self.get_row(board, row))
+            lines.append(BOARD_MID if row < 8 else BOARD_BOTTOM)
+        lines.append("White: {}\n\n".format(names[1]))
+        return "\n".join(lines)
+
+
+# Renderer of Board.display_board(), shared by all boards drawn on the
+# console since they share the screen
+RENDERER = BoardRenderer()
+
+
+class Instrumentation:
+    """Opt-in call counters and timers of the hot methods of the game
+
+    While enabled, the methods in TARGETS are replaced on their classes by
+    wrappers counting and timing their calls, and the counts are summed up
+    per turn and per game. Disabling puts the original methods back, so
+    that the instrumentation costs nothing while it is off. Calls are
+    attributed to the turn in progress, whatever the game, so aggregates
+    are meaningful for one game played at a time. Calls after a game has
+    ended, such as showing the final board, count toward its last turn
+    until the next game is constructed.
+    """
+
+    TARGETS = (("Game", "get_available_moves"),
+               ("Board", "valid_jumps"),
+               ("Board", "valid_moves"),
+               ("Board", "jump_room_exists"),
+               ("Board", "move_piece_to"),
+               ("Board", "display_board"))
+
+    def __init__(self):
+        """Construct disabled instrumentation"""
+        # Original method of each wrapped (class name, method name)
+        self._originals = {}
+        self.reset()
+
+    @property
+    def enabled(self):
+        """True while the methods are instrumented"""
+        return bool(self._originals)
+
+    def reset(self):
+        """Clear all counts"""
+        # [calls, seconds] of each method in the turn in progress
+        self._turn = {}
+        # Completed turns of the current game, and the finished games, each
+        # holding its turns. Turns keep their counts as _turn does.
+        self._turns = []
+        self._games = []
+        # Move being recorded, and whether the last game has ended
+        self._move = None
+        self._game_over = False
+
+    def enable(self):
+        """Start counting and timing the calls of the methods in TARGETS"""
+        if self.enabled:
+            return
+        classes = {"Game": Game, "Board": Board}
+        for class_name, name in self.TARGETS:
+            cls = classes[class_name]
+            original = cls.__dict__[name]
+            self._originals[class_name, name] = original
+            setattr(cls, name, self._wrap(name, original))
+        for name, wrap in (("__init__", self._wrap_game_start),
+                           ("_record_move", self._wrap_turn_end),
+                           ("_finish", self._wrap_game_end)):
+            original = Game.__dict__[name]
+            self._originals["Game", name] = original
+            setattr(Game, name, wrap(original))
+
+    def disable(self):
+        """Put the original methods back"""
+        classes = {"Game": Game, "Board": Board}
+        for (class_name, name), original in self._originals.items():
+            setattr(classes[class_name], name, original)
+        self._originals = {}
+
+    def _wrap(self, name, function):
+        """Return function wrapped to count and time its calls"""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counts = self._turn.get(name)
+                if counts is None:
+                    counts = self._turn[name] = [0, 0.0]
+                counts[0] += 1
+                counts[1] += time.perf_counter() - start
+        return wrapper
+
+    def _wrap_game_start(self, init):
+        """Return Game.__init__ wrapped to close the last game's counts"""
+        @functools.wraps(init)
+        def wrapper(game, *args, **kwargs):
+            self._add_to_last_game()
+            self._game_over = False
+            init(game, *args, **kwargs)
+        return wrapper
+
+    def _wrap_turn_end(self, record_move):
+        """Return Game._record_move wrapped to close the turn's counts"""
+        @functools.wraps(record_move)
+        def wrapper(game, move):
+            # A move ending the game closes the turn in Game._finish
+            self._move = move
+            try:
+                record_move(game, move)
+            finally:
+                self._move = None
+            if not game.is_over:
+                self._end_turn(game, move)
+        return wrapper
+
+    def _wrap_game_end(self, finish):
+        """Return Game._finish wrapped to close the game's counts"""
+        @functools.wraps(finish)
+        def wrapper(game, *args, **kwargs):
+            finish(game, *args, **kwargs)
+            self._end_game(game)
+        return wrapper
+
+    def _end_turn(self, game, move):
+        """Close the counts of the turn just completed by move"""
+        self._turns.append({
+            "ply": len(game.history),
+            "move": None if move is None else move_to_pdn(move),
+            "calls": self._turn})
+        self._turn = {}
+
+    def _end_game(self, game):
+        """Close the counts of the game just ended
+
+        A turn ended by resigning or agreeing to a draw has no move.
+        """
+        if self._move is not None or self._turn:
+            self._end_turn(game, self._move)
+        self._games.append({"plies": len(game.history),
+                            "result": game.result,
+                            "turns": self._turns})
+        self._turns = []
+        self._game_over = True
+
+    def _add_to_last_game(self):
+        """Add the calls made since the last game ended to its last turn"""
+        if not (self._game_over and self._turn):
+            return
+        game = self._games[-1]
+        if not game["turns"]:
+            game["turns"].append({"ply": game["plies"], "move": None,
+                                  "calls": {}})
+        self._add_counts(game["turns"][-1]["calls"], self._turn)
+        self._turn = {}
+
+    @staticmethod
+    def _add_counts(total, counts):
+        """Add the [calls, seconds] of each method in counts to total"""
+        for name, (calls, seconds) in counts.items():
+            summed = total.setdefault(name, [0, 0.0])
+            summed[0] += calls
+            summed[1] += seconds
+
+    @classmethod
+    def _game_summary(cls, turns):
+        """Return the summary of the counts of all turns"""
+        total = {}
+        for turn in turns:
+            cls._add_counts(total, turn["calls"])
+        return cls._summary(total)
+
+    @classmethod
+    def _turn_summaries(cls, turns):
+        """Return turns with their counts summarized"""
+        return [dict(turn, calls=cls._summary(turn["calls"]))
+                for turn in turns]
+
+    @staticmethod
+    def _summary(counts):
+        """Return {method: {"calls": n, "seconds": s}} of counts"""
+        return {name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in sorted(counts.items())}
+
+    def get_stats(self):
+        """Return the counts as a dict
+
+        The dict holds the counts of the turn in progress ("turn"), of
+        each completed turn of the current game ("turns"), of the current
+        game as a whole ("game") and of each finished game ("games"), the
+        latter with the counts of the game as a whole and of its turns.
+        """
+        self._add_to_last_game()
+        return {"enabled": self.enabled,
+                "turn": self._summary(self._turn),
+                "turns": self._turn_summaries(self._turns),
+                "game": self._game_summary(self._turns),
+                "games": [{"plies": game["plies"],
+                           "result": game["result"],
+                           "calls": self._game_summary(game["turns"]),
+                           "turns": self._turn_summaries(game["turns"])}
+                          for game in self._games]}
+
+    def dump(self, stream):
+        """Write the counts of get_stats() to stream as JSON"""
+        json.dump(self.get_stats(), stream, indent=2)
+        stream.write("\n")
+
+
+# Instrumentation of the game's hot methods, off unless enabled
+INSTRUMENTATION = Instrumentation()
+
+
+def shift_bits(bits, shift):
+    """Shift bitboard by signed number of squares, dropping off-board bits"""
+    if shift > 0:
+        return (bits << shift) & FULL_BOARD
+    return bits >> -shift
+
+
+def step_bits(bits, direction):
+    """Move every square in bits one diagonal step in direction"""
+    stepped = 0
+    for mask, shift in BIT_STEPS[direction]:
+        stepped |= shift_bits(bits & mask, shift)
+    return stepped
+
+
+def iter_bits(bits):
+    """Yield the square index of each set bit in ascending order"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BitBoard:
+    """Game board for checkers backed by three 32-bit integers
+
+    Bit n of self.black, self.white and self.kings is set if square index n
+    (0-31, same as Board.squares) holds a black piece, a white piece or a
+    king of either color respectively. Simple moves and jumps of all pieces
+    of a side are generated together with bitwise shifts and masks, instead
+    of square by square.
+    """
+
+    __slots__ = ("black", "white", "kings")
+
+    def __init__(self, black=0x00000FFF, white=0xFFF00000, kings=0):
+        """Construct bitboard, by default in the starting position"""
+        self.black = black
+        self.white = white
+        self.kings = kings
+
+    @classmethod
+    def from_board(cls, board):
+        """Return BitBoard holding the same position as board"""
+        black = white = kings = 0
+        for idx in range(32):
+            piece = board.get_square(idx)
+            if piece:
+                bit = 1 << idx
+                if piece[0] == "b":
+                    black |= bit
+                else:
+                    white |= bit
+                if piece[1] == "k":
+                    kings |= bit
+        return cls(black, white, kings)
+
+    def to_board(self):
+        """Return Board holding the same position as this bitboard"""
+        board = Board()
+        board.squares = self.squares
+        return board
+
+    @property
+    def squares(self):
+        """Tuple of piece strings indexed by square, as Board.squares"""
+        return tuple(self.get_square(idx) for idx in range(32))
+
+    def get_square(self, index):
+        """Return the piece on the board by index
+
+        Valid index values are in the 0-31 range."""
+        if not 0 <= index < 32:
+            raise IndexError("square index out of range")
+        bit = 1 << index
+        if self.black & bit:
+            return "bk" if self.kings & bit else "bm"
+        if self.white & bit:
+            return "wk" if self.kings & bit else "wm"
+        return ""
+
+    def get_board_stats(self):
+        """Return stats of pieces and empty squares on the board"""
+        black_kings = bin(self.black & self.kings).count("1")
+        white_kings = bin(self.white & self.kings).count("1")
+        black = bin(self.black).count("1")
+        white = bin(self.white).count("1")
+        return {
+            "bm": black - black_kings,
+            "bk": black_kings,
+            "wm": white - white_kings,
+            "wk": white_kings,
+            "": 32 - black - white,
+        }
+
+    def side_moves(self, blacks_turn):
+        """Return all simple moves of a side as (from, to) index pairs"""
+        empty = ~(self.black | self.white) & FULL_BOARD
+        own = self.black if blacks_turn else self.white
+        kings = own & self.kings
+        south, north = (own, kings) if blacks_turn else (kings, own)
+        moves = []
+        if south:
+            for mask, shift in SOUTH_STEPS:
+                targets = (south & mask) << shift & empty
+                while targets:
+                    low = targets & -targets
+                    to = low.bit_length() - 1
+                    moves.append((to - shift, to))
+                    targets ^= low
+        if north:
+            for mask, shift in NORTH_STEPS:
+                targets = (north & mask) >> shift & empty
+                while targets:
+                    low = targets & -targets
+                    to = low.bit_length() - 1
+                    moves.append((to + shift, to))
+                    targets ^= low
+        moves.sort()
+        return moves
+
+    def side_jumps(self, blacks_turn):
+        """Return all single jumps of a side as (from, captured, to) tuples"""
+        empty = ~(self.black | self.white) & FULL_BOARD
+        if blacks_turn:
+            own, opp = self.black, self.white
+        else:
+            own, opp = self.white, self.black
+        kings = own & self.kings
+        south, north = (own, kings) if blacks_turn else (kings, own)
+        jumps = []
+        if south:
+            for mask, over, land in SOUTH_JUMPS:
+                sources = south & mask & (opp >> over) & (empty >> land)
+                while sources:
+                    low = sources & -sources
+                    frm = low.bit_length() - 1
+                    jumps.append((frm, frm + over, frm + land))
+                    sources ^= low
+        if north:
+            for mask, over, land in NORTH_JUMPS:
+                sources = north & mask & (opp << over) & (empty << land)
+                while sources:
+                    low = sources & -sources
+                    frm = low.bit_length() - 1
+                    jumps.append((frm, frm - over, frm - land))
+                    sources ^= low
+        jumps.sort()
+        return jumps
+
+    def get_available_moves(self, blacks_turn):
+        """Return all movable pieces of a side
+
+        The return value has the same form as that of
+        Checkers.get_available_moves(), a list of tuples of the form
+        (piece_index<int>, can_piece_jump?<boolean>).
+        """
+        jumpers, movers = self.movable_bits(blacks_turn)
+        pieces = jumpers | movers
+        available = []
+        while pieces:
+            low = pieces & -pieces
+            available.append((low.bit_length() - 1, jumpers & low != 0))
+            pieces ^= low
+        return available
+
+    def movable_bits(self, blacks_turn):
+        """Return (jumpers, movers) bitboards of a side
+
+        Jumpers are the pieces with an available jump, movers the pieces
+        without one that have an available simple move. Both are found by
+        shifting the empty squares and the opponent's pieces back onto the
+        pieces, without listing any move.
+        """
+        empty = ~(self.black | self.white) & FULL_BOARD
+        if blacks_turn:
+            own, opp = self.black, self.white
+        else:
+            own, opp = self.white, self.black
+        kings = own & self.kings
+        south, north = (own, kings) if blacks_turn else (kings, own)
+        jumpers = movers = 0
+        if south:
+            movers = south & ((empty >> 4) & STEP_S4 |
+                              (empty >> 5) & STEP_SE5 |
+                              (empty >> 3) & STEP_SW3)
+            opp4 = opp >> 4
+            jumpers = south & (
+                (opp4 & JUMP_SE4 | (opp >> 5) & JUMP_SE5) & (empty >> 9) |
+                (opp4 & JUMP_SW4 | (opp >> 3) & JUMP_SW3) & (empty >> 7))
+        if north:
+            movers |= north & ((empty << 4) & STEP_N4 |
+                               (empty << 5) & STEP_NW5 |
+                               (empty << 3) & STEP_NE3)
+            opp4 = opp << 4
+            jumpers |= north & (
+                (opp4 & JUMP_NW4 | (opp << 5) & JUMP_NW5) & (empty << 9) |
+                (opp4 & JUMP_NE4 | (opp << 3) & JUMP_NE3) & (empty << 7))
+        return jumpers, movers & ~jumpers
+
+    # Rendering works on the squares list, so it is shared with Board
+    get_row = Board.get_row
+    display_board = Board.display_board
+
+
+def boards_to_arrays(boards):
+    """Return the positions of boards as (black, white, kings, sides) arrays
+
+    The first three are arrays of bitboards, the last an array of bytes,
+    1 where black is to move.
+    """
+    black, white, kings = array(U32), array(U32), array(U32)
+    sides = array("B")
+    for board in boards:
+        bits = BitBoard.from_board(board)
+        black.append(bits.black)
+        white.append(bits.white)
+        kings.append(bits.kings)
+        sides.append(board.blacks_turn)
+    return black, white, kings, sides
+
+
+def encode_positions(black, white, kings, sides):
+    """Pack arrays of positions into one bytes buffer
+
+    The arguments are equal length sequences of bitboards and sides to move,
+    such as the arrays returned by boards_to_arrays() or NumPy arrays. The
+    buffer holds all black bitboards, then all white ones, all kings and
+    all sides, 13 bytes per position, so whole arrays are copied in one go.
+    """
+    count = len(sides)
+    if not len(black) == len(white) == len(kings) == count:
+        raise ValueError("position arrays differ in length")
+    chunks = []
+    for values, typecode in ((black, U32), (white, U32), (kings, U32),
+                             (sides, "B")):
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            dtype = "<u4" if typecode == U32 else "u1"
+            chunks.append(values.astype(dtype, copy=False).tobytes())
+            continue
+        if not (isinstance(values, array) and values.typecode == typecode):
+            values = array(typecode, values)
+        if sys.byteorder == "big" and typecode == U32:
+            values = array(typecode, values)
+            values.byteswap()
+        chunks.append(values.tobytes())
+    return b"".join(chunks)
+
+
+def decode_positions(data):
+    """Unpack a buffer from encode_positions() into arrays
+
+    Return (black, white, kings, sides) arrays as boards_to_arrays() does.
+    """
+    count, remainder = divmod(len(data), POSITION_STRUCT.size)
+    if remainder:
+        raise ValueError("buffer is not a whole number of positions")
+    view = memoryview(data)
+    arrays = []
+    for idx in range(3):
+        values = array(U32)
+        values.frombytes(view[idx*count*4:(idx+1)*count*4])
+        if sys.byteorder == "big":
+            values.byteswap()
+        arrays.append(values)
+    sides = array("B")
+    sides.frombytes(view[12*count:])
+    arrays.append(sides)
+    return tuple(arrays)
+
+
+def decode_positions_numpy(data):
+    """Return NumPy array views of a buffer from encode_positions()
+
+    Return (black, white, kings, sides) arrays that share memory with
+    data instead of copying it. Raise ImportError if NumPy is missing.
+    """
+    if numpy is None:
+        raise ImportError("decode_positions_numpy() requires NumPy")
+    count, remainder = divmod(len(data), POSITION_STRUCT.size)
+    if remainder:
+        raise ValueError("buffer is not a whole number of positions")
+    arrays = [numpy.frombuffer(data, "<u4", count, idx*count*4)
+              for idx in range(3)]
+    arrays.append(numpy.frombuffer(data, "u1", count, 12*count))
+    return tuple(arrays)
+
+
+def boards_to_codes(boards):
+    """Return the squares of boards as a NumPy array of piece codes
+
+    The array has one row of 32 piece codes (see PIECES) per board, in
+    the layout of Board.squares. Raise ImportError if NumPy is missing.
+    """
+    if numpy is None:
+        raise ImportError("boards_to_codes() requires NumPy")
+    data = b"".join(board.piece_codes() for board in boards)
+    return numpy.frombuffer(data, numpy.uint8).reshape(-1, 32).copy()
+
+
+def _pack_squares(flags):
+    """Return bitboards of an array of shape (n, 32) of square flags"""
+    packed = numpy.packbits(flags, axis=1, bitorder="little")
+    return packed.view("<u4")[:, 0].astype(numpy.uint32)
+
+
+def _unpack_squares(bitboards):
+    """Return the bitboards of an array of shape (4, n) as square flags
+
+    The flags are an array of shape (n, 32, 4).
+    """
+    data = numpy.ascontiguousarray(bitboards.T, "<u4").view(numpy.uint8)
+    flags = numpy.unpackbits(data, axis=1, bitorder="little").view(bool)
+    return flags.reshape(-1, len(DIRECTIONS), 32).transpose(0, 2, 1)
+
+
+def batch_move_masks(codes, blacks_turn=True):
+    """Return the legal simple moves and jumps of a batch of positions
+
+    Codes is an array of shape (positions, 32) holding the pieces of each
+    position in the layout of Board.squares, as piece codes (see PIECES
+    and boards_to_codes()) or piece strings. Blacks_turn is the side to
+    move, a bool or an array with one per position.
+
+    Return (moves, jumps), boolean arrays of shape (positions, 32, 4):
+    moves[p, sq, d] is set if the piece on square sq of position p may
+    make a legal simple move in direction DIRECTIONS[d], jumps[p, sq, d]
+    if it may jump in that direction. As jumps are mandatory, a position
+    with any jump has no legal simple move. A jump is only the first hop
+    of a possible multi-jump.
+
+    The positions are turned into arrays of bitboards, and the moves of
+    all of them are found with one set of array shifts and masks per
+    direction, as BitBoard does for one position. Raise ImportError if
+    NumPy is missing.
+    """
+    if numpy is None:
+        raise ImportError("batch_move_masks() requires NumPy")
+    codes = numpy.asarray(codes)
+    if codes.dtype.kind in "USO":
+        strings = codes
+        codes = numpy.zeros(strings.shape, numpy.uint8)
+        for code, piece in enumerate(PIECES):
+            codes[strings == piece] = code
+    if codes.ndim != 2 or codes.shape[1] != 32:
+        raise ValueError("positions must be an array of shape (n, 32)")
+    black = _pack_squares((codes == BLACK_MAN) | (codes == BLACK_KING))
+    white = _pack_squares((codes == WHITE_MAN) | (codes == WHITE_KING))
+    kings = _pack_squares((codes == BLACK_KING) | (codes == WHITE_KING))
+    empty = ~(black | white)
+    side = numpy.broadcast_to(numpy.asarray(blacks_turn, bool),
+                              black.shape)
+    own = numpy.where(side, black, white)
+    opponents = numpy.where(side, white, black)
+    men = own & ~kings
+    moves = numpy.empty((len(DIRECTIONS), len(own)), numpy.uint32)
+    jumps = numpy.empty_like(moves)
+    for idx, direction in enumerate(DIRECTIONS):
+        movers = (own & kings) | numpy.where(
+            side, men if direction in BLACK_DIRS else 0,
+            men if direction in WHITE_DIRS else 0)
+        # Squares whose neighbor in the direction is empty
+        back = OPPOSITE_DIR[direction]
+        open_squares = step_bits(empty, back)
+        moves[idx] = movers & open_squares
+        jumps[idx] = movers & step_bits(opponents & open_squares, back)
+    moves[:, numpy.bitwise_or.reduce(jumps, axis=0) != 0] = 0
+    return _unpack_squares(moves), _unpack_squares(jumps)
+
+
+class TranspositionTable:
+    """Fixed-size table of search results keyed by Zobrist hash
+
+    The table is preallocated as two arrays of unsigned 64-bit integers
+    (16 bytes per entry), one holding the full position hashes and the
+    other the packed entries, so its memory footprint does not change as it
+    fills up. The number of entries is the largest power of two fitting in
+    size_mb megabytes.
+
+    Replacement policies:
+    'always': a new entry always replaces the one in its slot
+    'depth': a new entry replaces one of the same position or a shallower
+        search, otherwise it is dropped
+    'two-tier': slots are paired, the first of each pair is depth-preferred
+        and the second always replaced. An entry pushed out of the first
+        slot moves to the second.
+    """
+
+    # Packed entry layout (low to high bits): valid flag (1), bound (2),
+    # depth (8), move from + 1 (6), move to (5), score + 2**31 (32)
+    _SCORE_OFFS = 1 << 31
+
+    def __init__(self, size_mb=16, policy="depth"):
+        """Construct transposition table of size_mb megabytes"""
+        if policy not in TT_POLICIES:
+            raise ValueError("unknown replacement policy: {}".format(policy))
+        entries = max(size_mb * 2**20 // 16, 2)
+        self.size = 1 << (entries.bit_length() - 1)
+        self.policy = policy
+        self.keys = array("Q", [0]) * self.size
+        self.data = array("Q", [0]) * self.size
+        # Index mask of a slot, or of the first slot of a pair
+        self._mask = self.size - 1 if policy != "two-tier" else self.size - 2
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the hit, miss and collision statistics"""
+        self.probes = self.hits = self.misses = self.collisions = 0
+        self.stores = self.overwrites = 0
+
+    def clear(self):
+        """Remove all entries"""
+        self.keys = array("Q", [0]) * self.size
+        self.data = array("Q", [0]) * self.size
+
+    @property
+    def filled(self):
+        """Number of slots holding an entry"""
+        return sum(1 for data in self.data if data)
+
+    def _slots(self, key):
+        """Return the slot indices a position may be stored in"""
+        idx = key & self._mask
+        return (idx, idx + 1) if self.policy == "two-tier" else (idx,)
+
+    def probe(self, key):
+        """Return the TTEntry stored for position hash key, or None
+
+        A miss where a slot holds a different position counts as a
+        collision.
+        """
+        self.probes += 1
+        collision = False
+        for idx in self._slots(key):
+            data = self.data[idx]
+            if data and self.keys[idx] == key:
+                self.hits += 1
+                return self._unpack(data)
+            collision = collision or bool(data)
+        self.misses += 1
+        self.collisions += collision
+        return None
+
+    def store(self, key, depth, bound, score, move=None):
+        """Store search result of position hash key subject to the policy
+
+        Move is the (from, to) squares of the best move, or None. Depth
+        must be in the 0-255 range. Return True if the entry was stored.
+        """
+        slots = self._slots(key)
+        idx = slots[0]
+        data = self.data[idx]
+        if data and self.keys[idx] != key:
+            deeper = (data >> 3) & 0xFF > depth
+            if self.policy == "depth" and deeper:
+                return False
+            if self.policy == "two-tier":
+                if deeper:
+                    # Keep the deeper entry, use the always-replace slot
+                    idx = slots[1]
+                else:
+                    # Push the shallower entry to the always-replace slot
+                    self._put(slots[1], self.keys[idx], data)
+                    self.data[idx] = 0
+        self.stores += 1
+        self._put(idx, key, self._pack(depth, bound, score, move))
+        return True
+
+    def _put(self, idx, key, data):
+        """Write packed entry to slot idx, counting any entry it replaces"""
+        if self.data[idx] and self.keys[idx] != key:
+            self.overwrites += 1
+        self.keys[idx] = key
+        self.data[idx] = data
+
+    def _pack(self, depth, bound, score, move):
+        """Return entry packed into a 64-bit integer"""
+        frm, to = (move[0] + 1, move[1]) if move else (0, 0)
+        return (1 | bound << 1 | depth << 3 | frm << 11 | to << 17 |
+                (score + self._SCORE_OFFS) << 22)
+
+    def _unpack(self, data):
+        """Return TTEntry unpacked from a 64-bit integer"""
+        frm = (data >> 11) & 0x3F
+        return TTEntry(
+            depth=(data >> 3) & 0xFF,
+            bound=(data >> 1) & 0x3,
+            score=(data >> 22) - self._SCORE_OFFS,
+            move=(frm - 1, (data >> 17) & 0x1F) if frm else None,
+        )
+
+    def get_stats(self):
+        """Return dict of table statistics"""
+        return {
+            "size": self.size,
+            "policy": self.policy,
+            "probes": self.probes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "hit_rate": self.hits / self.probes if self.probes else 0.0,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+        }
+
+
+def move_to_pdn(move):
+    """Return move in Portable Draughts Notation, e.g. '9-14' or '5x14x23'"""
+    separator = "x" if move.captures else "-"
+    return separator.join(str(square + 1) for square in move.path)
+
+
+def format_search_result(result):
+    """Return a one-line report of a SearchResult"""
+    return "depth {}, score {:+d}, {} nodes, {} qnodes, {:.0f} nps, " \
+        "pv {}".format(result.depth, result.score, result.nodes,
+                       result.qnodes, result.nps,
+                       " ".join(move_to_pdn(move) for move in result.pv))
+
+
+def score_to_tt(score, ply):
+    """Return a search score at ply as stored in the transposition table
+
+    Win and loss scores count plies from the root of the search; stored
+    scores count them from the position itself, so that they stay right
+    when the position is found again at another ply or in another search.
+    """
+    if score > WIN_BOUND:
+        return score + ply
+    if score < -WIN_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """Return a transposition table score as a search score at ply"""
+    if score > WIN_BOUND:
+        return score - ply
+    if score < -WIN_BOUND:
+        return score + ply
+    return score
+
+
+class SearchAborted(Exception):
+    """Raised to unwind a search when its time or node budget runs out"""
+
+
+class AIPlayer:
+    """Computer player searching with alpha-beta and iterative deepening
+
+    The player plugs into play_game() in place of a human player. Each
+    search deepens one ply at a time until time_limit (seconds per move) or
+    node_limit is used up, or max_depth is reached, and plays the best move
+    of the deepest completed iteration. A limit of None means no limit.
+    Positions are cached in a transposition table that is kept between
+    moves. Moves are searched in order of the transposition table move,
+    the longest jumps, the killer moves of the ply and the history
+    heuristic, unless move_ordering is False. Unless quiescence is False,
+    positions at the end of the search where the side to move must jump
+    are searched on through the jumps, so exchanges are scored when they
+    are over. With a Tablebase, positions it covers are scored exactly
+    from it instead of being searched, and with an OpeningBook, positions
+    in the book are played from it without searching.
+    """
+
+    def __init__(self, name='Computer', time_limit=1.0, node_limit=None,
+                 max_depth=64, tt_size_mb=16, tt_policy='two-tier',
+                 verbose=True, tablebase=None, book=None,
+                 move_ordering=True, quiescence=True):
+        """Construct computer player"""
+        self.name = name
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.verbose = verbose
+        self.tt = TranspositionTable(tt_size_mb, tt_policy)
+        self.tablebase = tablebase
+        self.book = book
+        self.move_ordering = move_ordering
+        self.quiescence = quiescence
+        self.nodes = 0
+        # Nodes of the quiescence search of the last search
+        self.qnodes = 0
+        # Positions of the last search scored from the tablebase
+        self.tb_hits = 0
+        # Beta cutoffs of the last search, and those by the first move
+        # searched
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        # Killer moves, the (from, to) squares of the last two quiet moves
+        # causing a cutoff, per ply
+        self._killers = []
+        # History heuristic score of quiet moves, indexed by from * 32 + to
+        self._history = [0] * 1024
+        self.last_result = None
+        # Searches in a row that scored the position level, by
+        # get_player_move_from()
+        self._level_searches = 0
+        # Remaining squares (standard notation) of the move being played
+        self._path = []
+
+    def get_player_move_from(self, game):
+        """Search for the next move and return the square to move from
+
+        Return 'r' to resign if there is no legal move, and 'd' to offer a
+        draw once DRAW_OFFER_SEARCHES searches in a row have scored an
+        endgame level. If the offer is declined, the next call plays on.
+        """
+        if self._level_searches >= DRAW_OFFER_SEARCHES:
+            self._level_searches = 0
+            return 'd'
+        result = self.search(game.board)
+        if result is None:
+            return 'r'
+        # Book moves are not searched and say nothing about the position
+        if result.depth and abs(result.score) <= DRAW_MARGIN and \
+                32 - game.board.piece_counts[EMPTY] <= DRAW_OFFER_PIECES:
+            self._level_searches += 1
+        else:
+            self._level_searches = 0
+        if self.verbose:
+            print("{} plays {}: {}, first move cutoffs {:.0%}".format(
+                self.name, move_to_pdn(result.move),
+                format_search_result(result), self.first_move_cutoff_rate))
+        self._path = [str(square + 1) for square in result.move.path]
+        return self._path.pop(0)
+
+    def get_player_move_to(self, game):
+        """Return the next square of the move being played"""
+        return self._path.pop(0)
+
+    def draw_accepted(self, game):
+        """Accept a draw offer unless ahead on material"""
+        # The offer comes from the side to move, the opponent of this player
+        accepted = self.evaluate(game.board) >= 0
+        if self.verbose:
+            print("{} {} the draw.".format(
+                self.name, "accepts" if accepted else "rejects"))
+        return accepted
+
+    @staticmethod
+    def evaluate(board):
+        """Return the static score of the position for the side to move"""
+        counts = board.piece_counts
+        score = (MAN_VALUE * (counts[BLACK_MAN] - counts[WHITE_MAN]) +
+                 KING_VALUE * (counts[BLACK_KING] - counts[WHITE_KING]))
+        return score if board.blacks_turn else -score
+
+    def search(self, board):
+        """Search the position on board for the side to move
+
+        Return the SearchResult of the deepest completed iteration, or None
+        if the side to move has no legal move. A book move is returned as
+        the result of a search of depth 0. The board is left unchanged.
+        """
+        moves = list(board.generate_moves())
+        if not moves:
+            return None
+        if self.book is not None:
+            move = self.book.choose_move(board)
+            if move is not None:
+                self.nodes = self.qnodes = self.tb_hits = 0
+                self.last_result = SearchResult(move, 0, 0, 0, 0.0, 0.0,
+                                                (move,))
+                return self.last_result
+        self.nodes = self.qnodes = 0
+        self.tb_hits = 0
+        self.cutoffs = self.first_move_cutoffs = 0
+        self._killers = [[] for _ in range(self.max_depth + 1)]
+        # Keep the history of earlier moves, but less of it
+        self._history = [score >> 1 for score in self._history]
+        start = time.perf_counter()
+        self._deadline = start + self.time_limit if self.time_limit else None
+        # The first iteration always completes, so there is a move to play
+        self._can_abort = False
+        self._pv = [[]]
+        result = None
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score = self._search_root(board, depth, moves)
+            except SearchAborted:
+                break
+            pv = self._pv[0]
+            result = SearchResult(pv[0], score, depth, 0, 0, 0, tuple(pv))
+            self._can_abort = True
+            # Search the best move first in the next iteration
+            moves.remove(pv[0])
+            moves.insert(0, pv[0])
+            if len(moves) == 1 or abs(score) > WIN_BOUND:
+                # Forced move or forced win/loss found
+                break
+        elapsed = time.perf_counter() - start
+        self.last_result = result._replace(
+            nodes=self.nodes, qnodes=self.qnodes, elapsed=elapsed,
+            nps=(self.nodes + self.qnodes) / elapsed if elapsed else 0.0)
+        return self.last_result
+
+    @property
+    def first_move_cutoff_rate(self):
+        """Fraction of the cutoffs of the last search by the first move"""
+        if not self.cutoffs:
+            return 0.0
+        return self.first_move_cutoffs / self.cutoffs
+
+    def _order_moves(self, moves, tt_move, ply):
+        """Sort moves in the order to search them at ply"""
+        if moves[0].captures:
+            # Jumps are mandatory, so either all moves are jumps or none
+            # is; try the longest first
+            moves.sort(key=lambda move: len(move.captures), reverse=True)
+            front = ()
+        else:
+            history = self._history
+            moves.sort(key=lambda move: history[move.path[0] * 32 +
+                                                move.path[-1]],
+                       reverse=True)
+            front = self._killers[ply][::-1]
+        if tt_move is not None:
+            front = tuple(front) + (tt_move,)
+        # Move the killers, then the table move, to the front
+        for key in front:
+            for idx, move in enumerate(moves):
+                if (move.path[0], move.path[-1]) == key:
+                    if idx:
+                        moves.insert(0, moves.pop(idx))
+                    break
+
+    def _store_cutoff(self, move, depth, ply):
+        """Remember a quiet move causing a cutoff at ply"""
+        if move.captures:
+            return
+        key = (move.path[0], move.path[-1])
+        killers = self._killers[ply]
+        if key not in killers:
+            killers.insert(0, key)
+            del killers[2:]
+        self._history[key[0] * 32 + key[1]] += depth * depth
+
+    def _check_budget(self):
+        """Raise SearchAborted if the time or node budget is used up"""
+        if not self._can_abort:
+            return
+        nodes = self.nodes + self.qnodes
+        if self.node_limit is not None and nodes >= self.node_limit:
+            raise SearchAborted()
+        if (self._deadline is not None and not nodes & 1023 and
+                time.perf_counter() >= self._deadline):
+            raise SearchAborted()
+
+    def _search_root(self, board, depth, moves):
+        """Search root moves to depth, in order, and return the best score"""
+        alpha = -WIN_SCORE - 1
+        self.nodes += 1
+        for move in moves:
+            board.make_move(move)
+            try:
+                score = -self._negamax(board, depth - 1, -WIN_SCORE - 1,
+                                       -alpha, 1)
+            finally:
+                board.unmake_move()
+            if score > alpha:
+                alpha = score
+                self._pv[0] = [move] + self._pv[1]
+        best = self._pv[0][0]
+        self.tt.store(board.zobrist_hash, depth, TT_EXACT, alpha,
+                      (best.path[0], best.path[-1]))
+        return alpha
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        """Return the alpha-beta score of the position for the side to move
+
+        The principal variation found from this node is left in
+        self._pv[ply].
+        """
+        self.nodes += 1
+        self._check_budget()
+        pv = self._pv
+        if ply + 1 >= len(pv):
+            pv.append([])
+        pv[ply] = []
+        if not board.has_moves(board.blacks_turn):
+            # No piece to play, the side to move has lost
+            return ply - WIN_SCORE
+        tablebase = self.tablebase
+        if (tablebase is not None and
+                32 - board.piece_counts[EMPTY] <= tablebase.max_pieces):
+            entry = tablebase.probe(board)
+            if entry is not None:
+                self.tb_hits += 1
+                if entry.outcome == TB_WIN:
+                    return WIN_SCORE - ply - entry.plies
+                if entry.outcome == TB_LOSS:
+                    return ply + entry.plies - WIN_SCORE
+                return 0
+        if depth <= 0:
+            if self.quiescence:
+                return self._quiesce(board, alpha, beta, ply)
+            return self.evaluate(board)
+        key = board.zobrist_hash
+        entry = self.tt.probe(key)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry.move
+            if entry.depth >= depth:
+                score = score_from_tt(entry.score, ply)
+                if entry.bound == TT_EXACT:
+                    return score
+                if entry.bound == TT_LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+        moves = list(board.generate_moves())
+        if self.move_ordering:
+            if len(moves) > 1:
+                self._order_moves(moves, tt_move, ply)
+        elif tt_move is not None:
+            # Try the best move stored for this position first
+            moves.sort(key=lambda move: (move.path[0], move.path[-1]) !=
+                       tt_move)
+        alpha_orig = alpha
+        best_score = -WIN_SCORE - 1
+        best_move = None
+        for idx, move in enumerate(moves):
+            board.make_move(move)
+            try:
+                score = -self._negamax(board, depth - 1, -beta, -alpha,
+                                       ply + 1)
+            finally:
+                board.unmake_move()
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    pv[ply] = [move] + pv[ply + 1]
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        self.first_move_cutoffs += idx == 0
+                        if self.move_ordering:
+                            self._store_cutoff(move, depth, ply)
+                        break
+        if best_score <= alpha_orig:
+            bound = TT_UPPER
+        elif best_score >= beta:
+            bound = TT_LOWER
+        else:
+            bound = TT_EXACT
+        self.tt.store(key, depth, bound, score_to_tt(best_score, ply),
+                      (best_move.path[0], best_move.path[-1]))
+        return best_score
+
+    def _quiesce(self, board, alpha, beta, ply):
+        """Return the score of the position once no jump is pending
+
+        Only jumps are searched, with alpha-beta pruning, longest first.
+        A side that cannot jump gets the static score, but a side that
+        can must jump, so it cannot stop at the static score instead.
+        """
+        self.qnodes += 1
+        self._check_budget()
+        pv = self._pv
+        if ply + 1 >= len(pv):
+            pv.append([])
+        pv[ply] = []
+        if not board.has_moves(board.blacks_turn):
+            return ply - WIN_SCORE
+        if not board.has_jumps(board.blacks_turn):
+            return self.evaluate(board)
+        moves = list(board.generate_moves())
+        if len(moves) > 1:
+            moves.sort(key=lambda move: len(move.captures), reverse=True)
+        best_score = -WIN_SCORE - 1
+        for move in moves:
+            board.make_move(move)
+            try:
+                score = -self._quiesce(board, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    pv[ply] = [move] + pv[ply + 1]
+                    if alpha >= beta:
+                        break
+        return best_score
+
+
+def perft(board, depth):
+    """Return the number of leaf positions depth plies from the board
+
+    Every complete move, including each distinct multi-jump, counts as one
+    ply. The board is left unchanged.
+    """
+    moves = list(board.generate_moves())
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def perft_divide(board, depth):
+    """Return list of (move, leaf count) pairs for each root move"""
+    counts = []
+    for move in list(board.generate_moves()):
+        board.make_move(move)
+        counts.append((move, perft(board, depth - 1)))
+        board.unmake_move()
+    return counts
+
+
+def run_perft(board, depth, divide=False):
+    """Print perft node counts, time and speed for depths 1 to depth"""
+    print("Position: {}".format(board.to_fen()))
+    for curr_depth in range(1, depth + 1):
+        start = time.perf_counter()
+        nodes = perft(board, curr_depth)
+        elapsed = time.perf_counter() - start
+        print("depth {:>2}: {:>12} nodes {:>9.3f} s {:>12.0f} nps".format(
+            curr_depth, nodes, elapsed, nodes / elapsed if elapsed else 0))
+    if divide:
+        print("Divide at depth {}:".format(depth))
+        for move, nodes in perft_divide(board, depth):
+            print("{:>12} {:>12}".format(move_to_pdn(move), nodes))
+
+
+def _tb_materials(max_pieces):
+    """Return the material signatures of tables of up to max_pieces pieces
+
+    A signature is the number of black men, black kings, white men and
+    white kings. Both sides have at least one piece. Signatures are in an
+    order where captures and crowning, which lower the number of pieces
+    or men, only lead to signatures that come before.
+    """
+    materials = [material for material in
+                 itertools.product(range(max_pieces + 1), repeat=4)
+                 if sum(material) <= max_pieces and
+                 material[0] + material[1] and material[2] + material[3]]
+    materials.sort(key=lambda material: (sum(material),
+                                         material[0] + material[2], material))
+    return materials
+
+
+def _tb_table_size(material):
+    """Return the number of index slots of the table of a material"""
+    size = 2
+    for (_, squares), count in zip(TB_GROUPS, material):
+        size *= BINOMIAL[squares][count]
+    return size
+
+
+def _tb_index(codes, blacks_turn, material):
+    """Return the index of a position in the table of its material
+
+    The squares of each piece type are ranked as a combination, men among
+    the 28 squares they can stand on, and the ranks are combined with the
+    side to move into one index.
+    """
+    groups = ([], [], [], [])
+    for square, code in enumerate(codes):
+        if code:
+            groups[code - 1].append(square)
+    index = 0
+    for (first, squares), group in zip(TB_GROUPS, groups):
+        rank = 0
+        for count, square in enumerate(group, 1):
+            rank += BINOMIAL[square - first][count]
+        index = index * BINOMIAL[squares][len(group)] + rank
+    return index * 2 + blacks_turn
+
+
+def _tb_decode(value):
+    """Return the TBEntry of a table byte"""
+    if value == 0:
+        return TBEntry(TB_DRAW, 0)
+    if value < 128:
+        return TBEntry(TB_WIN, value)
+    return TBEntry(TB_LOSS, value - 128)
+
+
+def _tb_encode(outcome, plies):
+    """Return the table byte of an outcome in plies"""
+    if plies > 127:
+        raise ValueError("distance of {} plies does not fit the table".format(
+            plies))
+    if outcome == TB_WIN:
+        return plies
+    return 128 + plies if outcome == TB_LOSS else 0
+
+
+def _tb_positions(material):
+    """Yield (index, board) of every legal position of a material"""
+    first_squares = [range(first, first + squares)
+                     for first, squares in TB_GROUPS]
+    placements = [itertools.combinations(squares, count)
+                  for squares, count in zip(first_squares, material)]
+    for groups in itertools.product(*placements):
+        codes = bytearray(32)
+        taken = 0
+        for code, group in enumerate(groups, 1):
+            for square in group:
+                codes[square] = code
+            taken += len(group)
+        if codes.count(EMPTY) != 32 - taken:
+            # Pieces of different types on the same square
+            continue
+        for blacks_turn in (False, True):
+            yield (_tb_index(codes, blacks_turn, material),
+                   Board.from_codes(codes, blacks_turn))
+
+
+def _tb_solve(material, offsets, values, offset):
+    """Fill in the table of a material by retrograde analysis
+
+    The tables of the materials a capture or crowning leads to must be in
+    values already. Positions whose outcome follows from moves into those
+    tables or from having no move are queued by distance in plies, and
+    resolving each one in order of distance updates the positions that
+    move into it, so that each position gets its shortest win or longest
+    loss. Positions never resolved are draws.
+    """
+    # Positions that move to each position of the table
+    predecessors = {}
+    # Moves to unresolved positions of the table, of positions that lose
+    # unless one of those turns out to be lost for the opponent, and the
+    # longest such loss so far
+    unresolved = {}
+    longest_loss = {}
+    # Positions by the distance in plies at which they may be resolved
+    queue = {}
+    for index, board in _tb_positions(material):
+        best_win = None
+        longest = 0
+        draw = False
+        internal = 0
+        for move in list(board.generate_moves()):
+            board.make_move(move)
+            counts = board.piece_counts
+            successor = (counts[BLACK_MAN], counts[BLACK_KING],
+                         counts[WHITE_MAN], counts[WHITE_KING])
+            if successor == material:
+                successor_index = _tb_index(board.piece_codes(),
+                                            board.blacks_turn, material)
+                predecessors.setdefault(successor_index, []).append(index)
+                internal += 1
+                board.unmake_move()
+                continue
+            if successor not in offsets:
+                # The opponent has no piece left
+                outcome, plies = TB_LOSS, 0
+            else:
+                outcome, plies = _tb_decode(values[
+                    offsets[successor] + _tb_index(
+                        board.piece_codes(), board.blacks_turn, successor)])
+            board.unmake_move()
+            if outcome == TB_LOSS:
+                if best_win is None or plies + 1 < best_win:
+                    best_win = plies + 1
+            elif outcome == TB_WIN:
+                longest = max(longest, plies + 1)
+            else:
+                draw = True
+        if best_win is not None:
+            queue.setdefault(best_win, []).append((index, TB_WIN))
+        elif not draw:
+            if internal:
+                unresolved[index] = internal
+                longest_loss[index] = longest
+            else:
+                # No move at all, or every move loses
+                queue.setdefault(longest, []).append((index, TB_LOSS))
+    resolved = set()
+    while queue:
+        plies = min(queue)
+        for index, outcome in queue.pop(plies):
+            if index in resolved:
+                continue
+            resolved.add(index)
+            values[offset + index] = _tb_encode(outcome, plies)
+            for predecessor in predecessors.get(index, ()):
+                if predecessor in resolved:
+                    continue
+                if outcome == TB_LOSS:
+                    queue.setdefault(plies + 1, []).append(
+                        (predecessor, TB_WIN))
+                elif predecessor in unresolved:
+                    unresolved[predecessor] -= 1
+                    longest_loss[predecessor] = max(
+                        longest_loss[predecessor], plies + 1)
+                    if not unresolved[predecessor]:
+                        queue.setdefault(longest_loss[predecessor], []).append(
+                            (predecessor, TB_LOSS))
+
+
+def build_tablebase(path, max_pieces=3, verbose=False):
+    """Build the tablebase of all positions of up to max_pieces pieces
+
+    The outcome of every position with the side to move, and its distance
+    in plies to the end of the game with best play, is found by
+    retrograde analysis and written to the file named path: a header
+    listing the material signatures and where their tables start, then
+    one byte per position. Building takes time and memory growing fast
+    with max_pieces: 3 pieces take under a minute, 4 pieces well over
+    ten. Return the number of bytes of tables written.
+    """
+    materials = _tb_materials(max_pieces)
+    offsets = {}
+    size = 0
+    for material in materials:
+        offsets[material] = size
+        size += _tb_table_size(material)
+    values = bytearray(size)
+    for material in materials:
+        start = time.perf_counter()
+        _tb_solve(material, offsets, values, offsets[material])
+        if verbose:
+            print("Solved {} bm, {} bk, {} wm, {} wk in {:.1f} s".format(
+                *material, time.perf_counter() - start))
+    data_start = TB_HEADER.size + TB_MATERIAL.size * len(materials)
+    with open(path, "wb") as stream:
+        stream.write(TB_HEADER.pack(TB_MAGIC, max_pieces, len(materials)))
+        for material in materials:
+            stream.write(TB_MATERIAL.pack(*material,
+                                          data_start + offsets[material]))
+        stream.write(values)
+    return size
+
+
+class Tablebase:
+    """Endgame tablebase file written by build_tablebase()
+
+    The file is memory-mapped rather than read, so only the pages probed
+    are loaded, and processes probing the same file share them.
+    """
+
+    def __init__(self, path):
+        """Map the tablebase file named path, raise ValueError if invalid"""
+        with open(path, "rb") as stream:
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_pieces, count = TB_HEADER.unpack_from(self._map)
+        if magic != TB_MAGIC:
+            self._map.close()
+            raise ValueError("not a tablebase file: {}".format(path))
+        # Start of the table of each material signature
+        self._offsets = {}
+        for idx in range(count):
+            values = TB_MATERIAL.unpack_from(
+                self._map, TB_HEADER.size + idx * TB_MATERIAL.size)
+            self._offsets[values[:4]] = values[4]
+
+    def probe(self, board):
+        """Return the TBEntry of the position on board, for the side to move
+
+        Return None if the position is not in the tablebase.
+        """
+        counts = board.piece_counts
+        material = (counts[BLACK_MAN], counts[BLACK_KING],
+                    counts[WHITE_MAN], counts[WHITE_KING])
+        offset = self._offsets.get(material)
+        if offset is None:
+            return None
+        return _tb_decode(self._map[offset + _tb_index(
+            board.piece_codes(), board.blacks_turn, material)])
+
+    def close(self):
+        """Unmap the tablebase file"""
+        self._map.close()
+
+
+def build_opening_book(paths, output, max_plies=20, min_games=1):
+    """Build an opening book from the games in the PDN files paths
+
+    The moves of the first max_plies plies of each finished game are
+    counted by position, with the points they scored, and those played in
+    at least min_games games are written to the file named output, sorted
+    by the Zobrist hash of the position. Games that cannot be replayed or
+    have no result are skipped. Return the number of book entries.
+    """
+    stats = {}
+    for path in paths:
+        with open(path) as stream:
+            for pdn_game in read_pdn(stream):
+                game = pdn_game.game
+                if pdn_game.error or game.result not in BOOK_POINTS:
+                    continue
+                board = Board.from_fen(game.start_fen) if game.start_fen \
+                    else Board()
+                points = BOOK_POINTS[game.result]
+                for move in game.history[:max_plies]:
+                    key = (board.zobrist_hash, move.path[0], move.path[-1])
+                    games, total = stats.get(key, (0, 0))
+                    stats[key] = (games + 1,
+                                  total + points[board.blacks_turn])
+                    board.make_move(move)
+    entries = sorted((key + value for key, value in stats.items()
+                      if value[0] >= min_games),
+                     key=lambda entry: (entry[0], -entry[3]))
+    with open(output, "wb") as stream:
+        stream.write(BOOK_HEADER.pack(BOOK_MAGIC, len(entries)))
+        for entry in entries:
+            stream.write(BOOK_ENTRY.pack(*entry))
+    return len(entries)
+
+
+class OpeningBook:
+    """Opening book file written by build_opening_book()
+
+    Like a Tablebase, the file is memory-mapped and shared between the
+    processes using it. The entries of a position are found by binary
+    search on its hash.
+    """
+
+    def __init__(self, path):
+        """Map the book file named path, raise ValueError if invalid"""
+        with open(path, "rb") as stream:
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = BOOK_HEADER.unpack_from(self._map)
+        if magic != BOOK_MAGIC:
+            self._map.close()
+            raise ValueError("not an opening book file: {}".format(path))
+
+    def __len__(self):
+        """Return the number of book entries"""
+        return self._count
+
+    def _entry(self, idx):
+        """Return the entry at idx as a tuple"""
+        return BOOK_ENTRY.unpack_from(
+            self._map, BOOK_HEADER.size + idx * BOOK_ENTRY.size)
+
+    def probe(self, board):
+        """Return the BookMoves of the position on board, most played first
+
+        Entries that are not legal moves on board, from hash collisions,
+        are left out.
+        """
+        key = board.zobrist_hash
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._entry(mid)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        legal = {}
+        for move in board.generate_moves():
+            legal.setdefault((move.path[0], move.path[-1]), move)
+        book_moves = []
+        for idx in range(low, self._count):
+            entry_key, origin, dest, games, points = self._entry(idx)
+            if entry_key != key:
+                break
+            if (origin, dest) in legal:
+                book_moves.append(
+                    BookMove(legal[origin, dest], games, points))
+        return book_moves
+
+    def choose_move(self, board, rng=None):
+        """Return a book move for the position on board, or None
+
+        The most played move is chosen, or with a random.Random rng, a
+        move picked at random weighted by how often it was played.
+        """
+        book_moves = self.probe(board)
+        if not book_moves:
+            return None
+        if rng is None:
+            return book_moves[0].move
+        return rng.choices(book_moves, [book_move.games
+                                        for book_move in book_moves])[0].move
+
+    def close(self):
+        """Unmap the book file"""
+        self._map.close()
+
+
+def pdn_game_text(tags, moves, result):
+    """Return a game in PDN notation
+
+    Tags is a list of (name, value) pairs, moves a list of moves in PDN
+    notation, e.g. '9-14', and result one of the PDN game results. A game
+    starting with white to move needs a FEN tag and its move numbers
+    begin with '1...'.
+    """
+    lines = ['[{} "{}"]'.format(name, value) for name, value in tags]
+    fen = dict(tags).get("FEN", "B")
+    offset = 0 if fen.startswith("B") else 1
+    tokens = []
+    for idx, move in enumerate(moves):
+        ply = idx + offset
+        if ply % 2 == 0:
+            tokens.append("{}. {}".format(ply//2 + 1, move))
+        elif idx == 0:
+            tokens.append("{}... {}".format(ply//2 + 1, move))
+        else:
+            tokens.append(move)
+    tokens.append(result)
+    # Wrap the move text at 79 characters
+    line = ""
+    lines.append("")
+    for token in tokens:
+        if line and len(line) + len(token) >= 79:
+            lines.append(line)
+            line = ""
+        line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def play_engine_game(player, start_fen=None, max_plies=MAX_GAME_PLIES,
+                     random_plies=0, seed=None):
+    """Play a game of player against itself and return the game record
+
+    The game starts from the position start_fen, or from the starting
+    position. The first random_plies moves are picked at random, from
+    seed, to vary the games. The game is drawn by threefold repetition or
+    after max_plies moves. The record is a dict holding the start position
+    in FEN, the moves and the result in PDN notation, the number of plies
+    and the reason the game ended.
+    """
+    game = Game('Engine', 'Engine', max_plies, DRAW_REPETITIONS)
+    if start_fen:
+        game.board = Board.from_fen(start_fen)
+    rng = random.Random(seed)
+    start = game.board.to_fen()
+    while not game.is_over:
+        if len(game.history) < random_plies:
+            moves = game.get_legal_moves()
+            move = rng.choice(moves) if moves else None
+        else:
+            result = player.search(game.board)
+            move = result.move if result else None
+        if move is None:
+            # A start position where the side to move has already lost
+            game.resign()
+            break
+        game.apply_move(move)
+    return {
+        "start": start,
+        "moves": [move_to_pdn(move) for move in game.history],
+        "result": game.result,
+        "plies": len(game.history),
+        "termination": game.termination or "win",
+    }
+
+
+def parse_pdn_games(stream):
+    """Yield (tags, moves, result) of each game in a PDN stream
+
+    The stream, e.g. an open text file, is read one line at a time, and
+    each game is yielded as soon as its result token (or the next game's
+    tags) is read, so files of any size can be parsed. Tags is a dict,
+    moves a list of move strings such as '9-14' or '5x14x23', and result
+    the game result token ('*' if there was none). Comments, variations,
+    move numbers and annotations are skipped. Tokens that cannot be read
+    are returned as moves, so that replaying them reports an error.
+    """
+    tags, moves = {}, []
+    # Nesting depth of {comments} and (variations) being skipped
+    comment = variation = 0
+    for line in stream:
+        for token in re.findall(r"\[[^\]]*\]|[{}();]|[^\s{}();]+", line):
+            if comment:
+                comment += token == "{"
+                comment -= token == "}"
+            elif token == "{":
+                comment = 1
+            elif token == ";":
+                # Comment to the end of the line
+                break
+            elif token in "()":
+                variation += 1 if token == "(" else -1
+            elif variation:
+                continue
+            elif token.startswith("["):
+                if moves:
+                    # Game without result token
+                    yield tags, moves, "*"
+                    tags, moves = {}, []
+                match = re.match(r'\[\s*(\w+)\s+"(.*)"\s*\]$', token)
+                if match:
+                    tags[match.group(1)] = match.group(2)
+            elif token in PDN_RESULTS:
+                yield tags, moves, token
+                tags, moves = {}, []
+            else:
+                # Drop move numbers, NAGs and move annotations
+                token = re.sub(r"^\d+\.+", "", token).rstrip("!?")
+                if token and not token.startswith("$"):
+                    moves.append(token)
+    if moves or tags:
+        yield tags, moves, "*"
+
+
+def match_pdn_move(game, text):
+    """Return the legal Move of game written as text in PDN notation
+
+    The move is matched by its full path, or if only the first and last
+    squares of a jump are given, by those. Raise IllegalMoveError if the
+    game is over or no single legal move matches.
+    """
+    if game.is_over:
+        raise IllegalMoveError("move {} after the game is over".format(text))
+    if not re.match(r"^\d+([-x]\d+)+$", text):
+        raise IllegalMoveError("unreadable move: {}".format(text))
+    path = tuple(int(number) - 1 for number in re.split("[-x]", text))
+    moves = game.get_legal_moves()
+    candidates = [move for move in moves if move.path == path]
+    if not candidates and len(path) == 2:
+        candidates = [move for move in moves if move.path[0] == path[0] and
+                      move.path[-1] == path[-1]]
+    if len(candidates) != 1:
+        raise IllegalMoveError("{} move: {}".format(
+            "ambiguous" if candidates else "illegal", text))
+    return candidates[0]
+
+
+def replay_pdn_game(tags, moves, result="*"):
+    """Replay the moves of a PDN game and return (game, error)
+
+    The game starts from the FEN tag position, if there is one. If a move
+    cannot be played, replaying stops and error is the reason, otherwise
+    error is None. If the moves end before the game does, the recorded
+    result, e.g. from a resignation, becomes the game result.
+    """
+    game = Game(tags.get("Black", "Black"), tags.get("White", "White"))
+    try:
+        if "FEN" in tags:
+            game.board = Board.from_fen(tags["FEN"])
+        for ply, text in enumerate(moves, 1):
+            try:
+                game.apply_move(match_pdn_move(game, text))
+            except IllegalMoveError as err:
+                return game, "ply {}: {}".format(ply, err)
+    except ValueError as err:
+        return game, str(err)
+    if not game.is_over:
+        game.result = PDN_RESULTS.get(result)
+    return game, None
+
+
+def read_pdn(stream):
+    """Yield a PdnGame for each game in a PDN stream, replaying its moves
+
+    Games are parsed and replayed one at a time, see parse_pdn_games().
+    """
+    for tags, moves, result in parse_pdn_games(stream):
+        game, error = replay_pdn_game(tags, moves, result)
+        yield PdnGame(tags, moves, result, game, error)
+
+
+def write_pdn_game(stream, game, tags=()):
+    """Write game to stream in PDN notation
+
+    Tags are extra (name, value) pairs written after the player names and
+    the result. The start position is written as a FEN tag unless it is
+    the starting position.
+    """
+    result = game.result or "*"
+    all_tags = [("Black", game.black_name), ("White", game.white_name),
+                ("Result", result)]
+    all_tags.extend(tags)
+    start_fen = game.start_fen or game.board.to_fen()
+    if start_fen != Board().to_fen():
+        all_tags.append(("FEN", start_fen))
+    stream.write(pdn_game_text(all_tags,
+                               [move_to_pdn(move) for move in game.history],
+                               result))
+
+
+# Engine of a self-play worker process, created by _init_selfplay_worker()
+_selfplay_player = None
+
+
+def _init_selfplay_worker(player_args, book_path=None):
+    """Create the engine of a self-play worker process
+
+    The workers map the same opening book file, if any, so its pages are
+    shared between them.
+    """
+    global _selfplay_player
+    book = OpeningBook(book_path) if book_path else None
+    _selfplay_player = AIPlayer(verbose=False, book=book, **player_args)
+
+
+def _selfplay_worker(task):
+    """Play the self-play game described by task and return its record"""
+    number, start_fen, game_args = task
+    record = play_engine_game(_selfplay_player, start_fen, seed=number,
+                              **game_args)
+    record["game"] = number
+    return record
+
+
+def _write_selfplay_pdn(stream, record):
+    """Write a self-play game record to stream in PDN notation"""
+    game, _ = replay_pdn_game({"Black": "Engine", "White": "Engine",
+                               "FEN": record["start"]},
+                              record["moves"], record["result"])
+    write_pdn_game(stream, game, [("Event", "Self-play"),
+                                  ("Round", record["game"]),
+                                  ("Termination", record["termination"])])
+
+
+def run_selfplay(games, output=None, positions=None, processes=None,
+                 time_limit=1.0, node_limit=None, max_depth=64,
+                 max_plies=MAX_GAME_PLIES, random_plies=4, book=None):
+    """Play engine-vs-engine games in a process pool
+
+    Games start from the starting position, or in turn from the FEN
+    positions in the list positions. The pool has processes workers, by
+    default one per CPU core, playing from the opening book file named
+    book, if given. Game records are written to the file named
+    output as the games finish, as PDN if its name ends with '.pdn' and
+    as JSON lines otherwise, or to standard output as JSON lines. Return
+    summary dict with the number of games, elapsed seconds, games per
+    second and the count of each result.
+    """
+    player_args = {"time_limit": time_limit, "node_limit": node_limit,
+                   "max_depth": max_depth}
+    game_args = {"max_plies": max_plies, "random_plies": random_plies}
+    starts = positions or [None]
+    tasks = [(number, starts[number % len(starts)], game_args)
+             for number in range(1, games + 1)]
+    as_pdn = bool(output) and output.lower().endswith(".pdn")
+    stream = open(output, "w") if output else sys.stdout
+    results = dict.fromkeys((BLACK_WINS, WHITE_WINS, DRAW), 0)
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(processes, _init_selfplay_worker,
+                                  (player_args, book)) as pool:
+            for record in pool.imap_unordered(_selfplay_worker, tasks):
+                if as_pdn:
+                    _write_selfplay_pdn(stream, record)
+                else:
+                    stream.write(json.dumps(record) + "\n")
+                stream.flush()
+                results[record["result"]] += 1
+    finally:
+        if output:
+            stream.close()
+    elapsed = time.perf_counter() - start
+    return {"games": games, "elapsed": elapsed,
+            "games_per_second": games / elapsed if elapsed else 0.0,
+            "results": results}
+
+
+def _validate_pdn_move(game, text):
+    """Play one PDN move hop by hop with the console rules
+
+    Return None if the move is legal, or (kind, message) of the error,
+    in which case the game is left as it was after the error.
+    """
+    if game.is_over:
+        return MOVE_AFTER_END, "move after the game is over"
+    if not re.match(r"^\d+([-x]\d+)+$", text):
+        return BAD_RECORD, "unreadable move"
+    path = [int(number) - 1 for number in re.split("[-x]", text)]
+    if not all(0 <= square < 32 for square in path):
+        return BAD_RECORD, "no such square"
+    if len(path) == 2 and "x" in text and tuple(path) not in CAPTURED_SQ:
+        # A multi-jump may be given by its first and last squares only
+        try:
+            path = list(match_pdn_move(game, text).path)
+        except IllegalMoveError:
+            pass
+    origin = path[0]
+    if not game.validate_pick(origin):
+        moves = game.get_available_moves()
+        if (origin, False) in moves and any(jump for _, jump in moves):
+            return MISSED_JUMP, "another piece must jump"
+        return ILLEGAL_MOVE, game.move_msg or \
+            "no piece to move from {}".format(origin + 1)
+    for hop, square in enumerate(path[1:], 1):
+        if hop > 1 and game.turn_is_complete(game.game_piece_to_move):
+            return ILLEGAL_MOVE, "the move ended at {}".format(
+                game.game_piece_to_move + 1)
+        if not game.validate_move_to(square):
+            if game.must_jump and square in \
+                    game.board.valid_moves(game.game_piece_to_move):
+                return MISSED_JUMP, game.move_msg
+            return ILLEGAL_MOVE, game.move_msg
+        game.move_piece_to(square)
+        game.game_piece_to_move = square
+    if not game.turn_is_complete(path[-1]):
+        return INCOMPLETE_JUMP, game.move_msg
+    game.end_turn()
+    return None
+
+
+def validate_pdn_game(tags, moves):
+    """Replay a PDN game hop by hop and return its validation report
+
+    Every move is checked with validate_pick(), validate_move_to() and
+    turn_is_complete(), as if it was entered at the console. The report is
+    a dict of the number of plies found legal and the first error, None
+    or a dict of its kind, ply, move and message. Moves after the first
+    error are not checked.
+    """
+    game = Game()
+    report = {"plies": 0, "error": None}
+    try:
+        if "FEN" in tags:
+            game.board = Board.from_fen(tags["FEN"])
+            if game.has_player_lost():
+                game.result = WHITE_WINS if game.blacks_turn else BLACK_WINS
+    except ValueError as err:
+        report["error"] = {"kind": BAD_RECORD, "ply": 0, "move": None,
+                           "message": str(err)}
+        return report
+    for ply, text in enumerate(moves, 1):
+        error = _validate_pdn_move(game, text)
+        if error:
+            report["error"] = {"kind": error[0], "ply": ply, "move": text,
+                               "message": error[1]}
+            break
+        report["plies"] = ply
+    return report
+
+
+def _validate_worker(batch):
+    """Validate a batch of (number, tags, moves) PDN games"""
+    reports = []
+    for number, tags, moves in batch:
+        report = validate_pdn_game(tags, moves)
+        report["game"] = number
+        reports.append(report)
+    return reports
+
+
+def _pdn_batches(stream, size):
+    """Yield lists of up to size numbered games parsed from stream"""
+    batch = []
+    for number, (tags, moves, result) in enumerate(
+            parse_pdn_games(stream), 1):
+        batch.append((number, tags, moves))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def validate_archive(path, output=None, processes=None):
+    """Check every game of the PDN file named path in a process pool
+
+    The file is parsed as it is read and its games are sent to the
+    processes workers (by default one per CPU core) in batches. The
+    reports of the games with an error, numbered by their position in
+    the file, are written in file order as JSON lines to the stream
+    output, if given. Return a summary dict with the number of games,
+    the number of invalid games, the count of each error kind, elapsed
+    seconds and games per second.
+    """
+    summary = {"games": 0, "invalid": 0, "errors": {}}
+    start = time.perf_counter()
+    with open(path) as stream, \
+            multiprocessing.Pool(processes) as pool:
+        batches = _pdn_batches(stream, VALIDATE_BATCH)
+        for reports in pool.imap(_validate_worker, batches):
+            summary["games"] += len(reports)
+            for report in reports:
+                if report["error"] is None:
+                    continue
+                summary["invalid"] += 1
+                kind = report["error"]["kind"]
+                summary["errors"][kind] = summary["errors"].get(kind, 0) + 1
+                if output is not None:
+                    output.write(json.dumps(report) + "\n")
+    summary["elapsed"] = time.perf_counter() - start
+    summary["games_per_second"] = summary["games"] / summary["elapsed"] \
+        if summary["elapsed"] else 0.0
+    return summary
+
+
+def encode_name(name):
+    """Return a player name in UTF-8, raise ValueError if it is too long"""
+    data = name.encode()
+    if len(data) > MAX_NAME_SIZE:
+        raise ValueError("name longer than {} bytes".format(MAX_NAME_SIZE))
+    return data
+
+
+class GameLog:
+    """Append-only binary log of the games hosted by a server
+
+    The start position and players of each game, every move and the end
+    of the game are appended to the log file as small binary records,
+    each checked by a CRC-32. Records are buffered and handed over in
+    batches of batch_size, or once the oldest buffered record is max_delay
+    seconds old, to a writer thread, which writes them in order with an
+    fsync after each write if fsync is true. Logging a move thus never
+    waits for the disk, so the log may be used from an asyncio event loop.
+    Moves not yet written are lost in a crash.
+
+    Every snapshot_every moves the positions of all live games are taken
+    and written by the writer thread to a snapshot file, named after the
+    log with '.snap' added, along with the log offset they cover.
+    recover() rebuilds the live games from the latest snapshot and the
+    log records after it. The history of a recovered game only holds the
+    moves replayed from the log tail.
+    """
+
+    def __init__(self, path, batch_size=64, max_delay=0.05, fsync=True,
+                 snapshot_every=4096):
+        """Construct log appending to the file named path"""
+        self.path = path
+        self.snapshot_path = path + ".snap"
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+        # Live games by number, the state a snapshot holds
+        self.games = {}
+        self._file = None
+        self._pending = []
+        self._pending_since = 0.0
+        self._moves_since_snapshot = 0
+        # Thread doing the file writes, in the order they are handed over,
+        # and the last write handed over
+        self._writer = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix="GameLog")
+        self._write = None
+
+    def start_game(self, number, game):
+        """Log the start of game, identified by number
+
+        Raise ValueError if a player name is longer than MAX_NAME_SIZE
+        bytes in UTF-8.
+        """
+        payload = [game.board.encode()]
+        for name in (game.black_name, game.white_name):
+            name = encode_name(name)
+            payload.extend((bytes((len(name),)), name))
+        self._append(LOG_START, number, b"".join(payload))
+        self.games[number] = game
+
+    def log_move(self, number, move):
+        """Log move, just played in the game identified by number"""
+        self._append(LOG_MOVE, number, bytes(move.path))
+        self._moves_since_snapshot += 1
+        if self._moves_since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def end_game(self, number, result):
+        """Log the end of the game identified by number"""
+        self.games.pop(number, None)
+        self._append(LOG_END, number, result.encode())
+
+    def _append(self, kind, number, payload):
+        """Buffer a record, writing the buffer if it is full or old"""
+        if len(payload) > LOG_MAX_PAYLOAD:
+            raise ValueError("log record too long")
+        record = LOG_HEADER.pack(kind, number, len(payload)) + payload
+        self._pending.append(record + LOG_CRC.pack(zlib.crc32(record)))
+        now = time.monotonic()
+        if len(self._pending) == 1:
+            self._pending_since = now
+        if (len(self._pending) >= self.batch_size or
+                now - self._pending_since >= self.max_delay):
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered records over to be written to the log file"""
+        if not self._pending:
+            return
+        self._submit(self._write_records, b"".join(self._pending))
+        self._pending = []
+
+    def _submit(self, function, *args):
+        """Have the writer thread call function with args
+
+        Raise the error of the last write, if it failed.
+        """
+        if self._write is not None and self._write.done():
+            self._write.result()
+        self._write = self._writer.submit(function, *args)
+
+    def wait(self):
+        """Wait until the records and snapshots handed over are written"""
+        if self._write is not None:
+            self._write.result()
+
+    def _write_records(self, data):
+        """Append records to the log file, in the writer thread"""
+        stream = self._open()
+        stream.write(data)
+        stream.flush()
+        if self.fsync:
+            os.fsync(stream.fileno())
+
+    def _open(self):
+        """Return the log file, opened for appending on first use"""
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        return self._file
+
+    def close(self):
+        """Write the buffered records and close the log file"""
+        self.flush()
+        self.wait()
+        self._writer.shutdown()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def snapshot(self):
+        """Write the positions of all live games to the snapshot file
+
+        The positions are taken now and written by the writer thread after
+        the records logged so far. The file is replaced atomically, so a
+        crash leaves either the old or the new snapshot.
+        """
+        self.flush()
+        parts = []
+        for number, game in self.games.items():
+            black = encode_name(game.black_name)
+            white = encode_name(game.white_name)
+            parts.append(SNAPSHOT_GAME.pack(
+                number, game.board.encode(), len(black), len(white)))
+            parts.extend((black, white))
+        self._submit(self._write_snapshot, len(self.games), b"".join(parts))
+        self._moves_since_snapshot = 0
+
+    def _write_snapshot(self, count, games):
+        """Write the snapshot file, in the writer thread"""
+        data = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self._open().tell(),
+                                    count) + games
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "wb") as stream:
+            stream.write(data + LOG_CRC.pack(zlib.crc32(data)))
+            stream.flush()
+            if self.fsync:
+                os.fsync(stream.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+    def _read_snapshot(self):
+        """Return the games of the snapshot file and the offset it covers
+
+        Raise ValueError if the snapshot file is corrupt.
+        """
+        try:
+            with open(self.snapshot_path, "rb") as stream:
+                data = stream.read()
+        except FileNotFoundError:
+            return {}, 0
+        body = data[:-LOG_CRC.size]
+        if (len(data) < SNAPSHOT_HEADER.size + LOG_CRC.size or
+                LOG_CRC.unpack_from(data, len(body))[0] !=
+                zlib.crc32(body)):
+            raise ValueError("corrupt snapshot: {}".format(
+                self.snapshot_path))
+        magic, offset, count = SNAPSHOT_HEADER.unpack_from(body)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("not a snapshot: {}".format(self.snapshot_path))
+        games = {}
+        pos = SNAPSHOT_HEADER.size
+        for _ in range(count):
+            number, position, black_size, white_size = \
+                SNAPSHOT_GAME.unpack_from(body, pos)
+            pos += SNAPSHOT_GAME.size
+            black = body[pos:pos + black_size].decode()
+            pos += black_size
+            white = body[pos:pos + white_size].decode()
+            pos += white_size
+            game = games[number] = Game(black, white)
+            game.board = Board.decode(position)
+        return games, offset
+
+    def recover(self):
+        """Rebuild the live games from the snapshot and the log tail
+
+        Return a dict of the games that have not ended, by number. The
+        log ends at the first record that is incomplete or fails its
+        check, as left by a crash while writing. It is cut off there, so
+        that new records follow the last complete one. Raise ValueError
+        if the log does not replay.
+        """
+        games, offset = self._read_snapshot()
+        try:
+            with open(self.path, "rb") as stream:
+                stream.seek(offset)
+                data = stream.read()
+        except FileNotFoundError:
+            data = b""
+        pos = 0
+        while pos + LOG_HEADER.size <= len(data):
+            kind, number, size = LOG_HEADER.unpack_from(data, pos)
+            end = pos + LOG_HEADER.size + size
+            if (end + LOG_CRC.size > len(data) or
+                    LOG_CRC.unpack_from(data, end)[0] !=
+                    zlib.crc32(data[pos:end])):
+                break
+            self._replay(games, kind, number, data[pos + LOG_HEADER.size:end])
+            pos = end + LOG_CRC.size
+        if pos < len(data):
+            with open(self.path, "r+b") as stream:
+                stream.truncate(offset + pos)
+        self.games = {number: game for number, game in games.items()
+                      if not game.is_over}
+        return dict(self.games)
+
+    @staticmethod
+    def _replay(games, kind, number, payload):
+        """Apply a log record to the games by number"""
+        if kind == LOG_START:
+            names = []
+            pos = POSITION_STRUCT.size
+            for _ in range(2):
+                size = payload[pos]
+                names.append(payload[pos + 1:pos + 1 + size].decode())
+                pos += 1 + size
+            game = games[number] = Game(*names)
+            game.board = Board.decode(payload[:POSITION_STRUCT.size])
+        elif kind == LOG_MOVE:
+            if number not in games:
+                raise ValueError("move log: move in unknown game {}".format(
+                    number))
+            games[number].apply_move(tuple(payload))
+        elif kind == LOG_END:
+            games.pop(number, None)
+
+
+class ServerClient:
+    """A connection to GameServer and the game session it plays in"""
+
+    __slots__ = ("writer", "session", "side")
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.session = None
+        # True if the client plays black
+        self.side = None
+
+    def send(self, line):
+        """Queue line to be sent to the client"""
+        self.writer.write(line.encode() + b"\n")
+
+
+class GameSession:
+    """A game hosted by GameServer with the clients playing it"""
+
+    __slots__ = ("number", "game", "clients")
+
+    def __init__(self, number, game):
+        self.number = number
+        self.game = game
+        # Client of each side, indexed by side (blacks_turn)
+        self.clients = [None, None]
+
+    @property
+    def started(self):
+        """True once both sides have a player"""
+        return self.game.white_name is not None
+
+    def broadcast(self, line):
+        """Queue line to be sent to every client of the game"""
+        for client in self.clients:
+            if client:
+                client.send(line)
+
+
+class GameServer:
+    """Host any number of games for clients of a line protocol
+
+    Every line a client sends is a command, answered by one or more lines:
+
+    NEW [name]        start a game as black: GAME <number> black
+    JOIN number [name]
+                      join the game as white: GAME <number> white, then
+                      both players get START <black> <white> and the board
+    MOVE move         make a move in PDN notation, e.g. 9-14 or 5x14x23:
+                      both players get MOVED <move> and the board
+    BOARD             the board: BOARD <FEN>, the side to move included
+    MOVES             the legal moves: MOVES <move> ...
+    RESIGN            resign the game
+    QUIT              close the connection: BYE
+
+    When a game ends, its players get RESULT <result>. A player leaving
+    a game that has not ended resigns it. Errors are answered with
+    ERROR <message>. Each game is a Game, and waiting for clients costs
+    no more than their connection.
+
+    With a GameLog, the games are logged as they are played and the games
+    live at the last crash are recovered from it, to be rejoined by
+    players with JOIN <number> into either side left free.
+    """
+
+    def __init__(self, log=None):
+        self.sessions = {}
+        self._last_number = 0
+        self.log = log
+        if log is not None:
+            for number, game in log.recover().items():
+                self.sessions[number] = GameSession(number, game)
+                self._last_number = max(self._last_number, number)
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start listening for clients and return the asyncio server"""
+        if self.log is not None:
+            asyncio.get_running_loop().create_task(self._flush_log())
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    async def _flush_log(self):
+        """Write the buffered log records of idle games in time"""
+        while True:
+            await asyncio.sleep(self.log.max_delay)
+            self.log.flush()
+
+    async def handle_client(self, reader, writer):
+        """Serve the commands of a client until it quits or disconnects"""
+        client = ServerClient(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode(errors="replace").split()
+                if not words:
+                    continue
+                command = words[0].upper()
+                if command == "QUIT":
+                    client.send("BYE")
+                    await writer.drain()
+                    break
+                if command in SERVER_COMMANDS:
+                    try:
+                        getattr(self, "_" + command.lower())(client,
+                                                             words[1:])
+                    except ValueError as err:
+                        client.send("ERROR {}".format(err))
+                else:
+                    client.send("ERROR unknown command: {}".format(words[0]))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._leave(client)
+            writer.close()
+
+    def _session_of(self, client):
+        """Return the started game session of client, raise ValueError"""
+        session = client.session
+        if session is None:
+            raise ValueError("not in a game")
+        if not session.started:
+            raise ValueError("waiting for an opponent")
+        return session
+
+    def _new(self, client, args):
+        if client.session and not client.session.game.is_over:
+            raise ValueError("already in game {}".format(
+                client.session.number))
+        name = args[0] if args else "Black"
+        encode_name(name)
+        self._leave(client)
+        self._last_number += 1
+        session = GameSession(self._last_number, Game(name, None))
+        session.clients[True] = client
+        client.session, client.side = session, True
+        self.sessions[session.number] = session
+        client.send("GAME {} black".format(session.number))
+
+    def _join(self, client, args):
+        if client.session and not client.session.game.is_over:
+            raise ValueError("already in game {}".format(
+                client.session.number))
+        try:
+            session = self.sessions[int(args[0])]
+        except (IndexError, ValueError, KeyError):
+            raise ValueError("no such game")
+        if not session.started:
+            name = args[1] if len(args) > 1 else "White"
+            encode_name(name)
+            session.game.white_name = name
+            if self.log is not None:
+                self.log.start_game(session.number, session.game)
+        elif all(session.clients):
+            raise ValueError("game {} is full".format(session.number))
+        self._leave(client)
+        # A new game is joined as white, a recovered one on a free side
+        side = session.clients[True] is None
+        session.clients[side] = client
+        client.session, client.side = session, side
+        client.send("GAME {} {}".format(session.number, SIDE_NAMES[side]))
+        session.broadcast("START {} {}".format(session.game.black_name,
+                                               session.game.white_name))
+        session.broadcast("BOARD {}".format(session.game.board.to_fen()))
+
+    def _move(self, client, args):
+        session = self._session_of(client)
+        game = session.game
+        if game.is_over:
+            raise ValueError("the game is over")
+        if client.side != game.blacks_turn:
+            raise ValueError("not your turn")
+        if not args:
+            raise ValueError("no move given")
+        move = match_pdn_move(game, args[0])
+        game.apply_move(move)
+        if self.log is not None:
+            self.log.log_move(session.number, move)
+        session.broadcast("MOVED {}".format(move_to_pdn(move)))
+        session.broadcast("BOARD {}".format(game.board.to_fen()))
+        if game.is_over:
+            self._end(session)
+
+    def _board(self, client, args):
+        self._session_of(client)
+        client.send("BOARD {}".format(client.session.game.board.to_fen()))
+
+    def _moves(self, client, args):
+        game = self._session_of(client).game
+        moves = [] if game.is_over else game.get_legal_moves()
+        client.send(" ".join(["MOVES"] +
+                             [move_to_pdn(move) for move in moves]))
+
+    def _resign(self, client, args):
+        session = self._session_of(client)
+        if session.game.is_over:
+            raise ValueError("the game is over")
+        session.game.resign(client.side)
+        self._end(session)
+
+    def _end(self, session):
+        """Announce the result of a finished game and stop hosting it"""
+        session.broadcast("RESULT {}".format(session.game.result))
+        self.sessions.pop(session.number, None)
+        if self.log is not None:
+            self.log.end_game(session.number, session.game.result)
+
+    def _leave(self, client):
+        """Remove client from its game, resigning it if it is not over"""
+        session = client.session
+        if session is None:
+            return
+        session.clients[client.side] = None
+        if not session.started:
+            self.sessions.pop(session.number, None)
+        elif not session.game.is_over:
+            session.game.resign(client.side)
+            self._end(session)
+        client.session = client.side = None
+
+
+async def serve(host="127.0.0.1", port=8765, log_path=None):
+    """Run a GameServer until cancelled, logging games to log_path"""
+    log = GameLog(log_path) if log_path else None
+    game_server = GameServer(log)
+    server = await game_server.start(host, port)
+    print("Serving checkers on {}".format(
+        ", ".join(str(sock.getsockname()) for sock in server.sockets)))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if log is not None:
+            log.close()
+
+
+def main(argv=None):
+    """Run the program selected by the command line arguments"""
+    parser = argparse.ArgumentParser(description="Console checkers game")
+    parser.add_argument(
+        "--computer", choices=("black", "white", "both"),
+        help="let the computer play the given side")
+    parser.add_argument(
+        "--movetime", type=float, default=1.0, metavar="SECONDS",
+        help="computer's thinking time per move (default: 1.0)")
+    parser.add_argument(
+        "--perft", type=int, metavar="N",
+        help="count leaf positions to depth N instead of playing")
+    parser.add_argument(
+        "--position", metavar="FEN",
+        help="start perft from this PDN FEN position, e.g. 'B:W21-32:B1-12'")
+    parser.add_argument(
+        "--divide", action="store_true",
+        help="with --perft, also print the leaf count of each root move")
+    parser.add_argument(
+        "--selfplay", type=int, metavar="N",
+        help="play N engine-vs-engine games instead of playing")
+    parser.add_argument(
+        "--positions", metavar="FILE",
+        help="with --selfplay, start games from the FEN positions in FILE, "
+        "one per line")
+    parser.add_argument(
+        "--output", metavar="FILE",
+        help="with --selfplay, write games to FILE as PDN if it ends with "
+        ".pdn, otherwise as JSON lines; with --validate, write the reports "
+        "of invalid games to FILE as JSON lines (default: standard output); "
+        "with --build-tablebase or --build-book, the file to write")
+    parser.add_argument(
+        "--validate", metavar="FILE",
+        help="check the legality of every game in the PDN file FILE "
+        "instead of playing")
+    parser.add_argument(
+        "--processes", type=int, metavar="N",
+        help="with --selfplay or --validate, number of worker processes "
+        "(default: one per CPU core)")
+    parser.add_argument(
+        "--nodes", type=int, metavar="N",
+        help="computer's node budget per move, instead of --movetime")
+    parser.add_argument(
+        "--save", metavar="FILE",
+        help="append the game played to FILE in PDN notation")
+    parser.add_argument(
+        "--profile", metavar="FILE",
+        help="count and time calls of the game's hot methods and write "
+        "the per-turn and per-game counts to FILE as JSON")
+    parser.add_argument(
+        "--serve", type=int, metavar="PORT",
+        help="host games for network clients on PORT instead of playing")
+    parser.add_argument(
+        "--host", default="127.0.0.1",
+        help="with --serve, address to listen on (default: 127.0.0.1)")
+    parser.add_argument(
+        "--log", metavar="FILE",
+        help="with --serve, log games to FILE and recover the games in "
+        "progress from it on start")
+    parser.add_argument(
+        "--build-tablebase", type=int, metavar="N",
+        help="build the endgame tablebase of up to N pieces into the "
+        "--output file instead of playing")
+    parser.add_argument(
+        "--tablebase", metavar="FILE",
+        help="let the computer look up endgames in the tablebase FILE")
+    parser.add_argument(
+        "--build-book", nargs="+", metavar="FILE",
+        help="build an opening book from the games in the PDN files FILE "
+        "into the --output file instead of playing")
+    parser.add_argument(
+        "--book", metavar="FILE",
+        help="let the computer (and --selfplay) play openings from the "
+        "book FILE")
+    args = parser.parse_args(argv)
+    if args.build_book:
+        if not args.output:
+            parser.error("--build-book requires --output")
+        print("{} book entries".format(
+            build_opening_book(args.build_book, args.output)))
+        return
+    if args.build_tablebase is not None:
+        if not args.output:
+            parser.error("--build-tablebase requires --output")
+        start = time.perf_counter()
+        size = build_tablebase(args.output, args.build_tablebase, True)
+        print("{} bytes of tables in {:.1f} s".format(
+            size, time.perf_counter() - start))
+        return
+    if args.selfplay is not None:
+        positions = None
+        if args.positions:
+            with open(args.positions) as stream:
+                positions = [line.strip() for line in stream if line.strip()]
+        summary = run_selfplay(
+            args.selfplay, args.output, positions, args.processes,
+            time_limit=None if args.nodes else args.movetime,
+            node_limit=args.nodes, book=args.book)
+        print("{} games in {:.1f} s, {:.2f} games/s, results {}".format(
+            summary["games"], summary["elapsed"],
+            summary["games_per_second"], summary["results"]),
+            file=sys.stderr if not args.output else sys.stdout)
+        return
+    if args.serve is not None:
+        try:
+            asyncio.run(serve(args.host, args.serve, args.log))
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.validate:
+        output = open(args.output, "w") if args.output else sys.stdout
+        try:
+            summary = validate_archive(args.validate, output, args.processes)
+        finally:
+            if args.output:
+                output.close()
+        print("{} games in {:.1f} s, {:.0f} games/s, {} invalid {}".format(
+            summary["games"], summary["elapsed"],
+            summary["games_per_second"], summary["invalid"],
+            summary["errors"]), file=sys.stderr)
+        return
+    if args.perft is not None:
+        try:
+            board = Board.from_fen(args.position) if args.position else \
+                Board()
+        except ValueError as err:
+            parser.error(str(err))
+        run_perft(board, args.perft, args.divide)
+        return
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    book = OpeningBook(args.book) if args.book else None
+    players = {}
+    for color in ("black", "white"):
+        players[color] = None
+        if args.computer in (color, "both"):
+            players[color] = AIPlayer(
+                name="Computer ({})".format(color),
+                time_limit=None if args.nodes else args.movetime,
+                node_limit=args.nodes, tablebase=tablebase, book=book)
+    # Games between two computers could go on forever without a ply limit
+    game = Checkers(max_plies=MAX_GAME_PLIES if args.computer == "both"
+                    else None, repetitions=DRAW_REPETITIONS)
+    if args.profile:
+        INSTRUMENTATION.enable()
+    try:
+        play_game(game, players["black"], players["white"])
+    finally:
+        if args.profile:
+            INSTRUMENTATION.disable()
+            with open(args.profile, "w") as stream:
+                INSTRUMENTATION.dump(stream)
+    if args.save:
+        with open(args.save, "a") as stream:
+            write_pdn_game(stream, game)
+
 
 if __name__ == "__main__":
-    game = Checkers()
-    play_game(game)
+    main()
@@ -1,10 +1,34 @@
 """Unit tests for checkers game"""
 
+import asyncio
+import json
+import os
+import random
+import threading
+import time
 from io import StringIO
 from unittest.mock import patch
 import pytest
-from .checkers import Checkers, Board
+from .checkers import Checkers, Board, BitBoard, Move, AIPlayer, play_game
+from .checkers import Game, IllegalMoveError, BLACK_WINS, WHITE_WINS, DRAW
 from .checkers import PIECE_DISP, BOX, WH_SQ
+from .checkers import NEIGHBOR_SQ, JUMP_SQ, CAPTURED_SQ
+from .checkers import TranspositionTable, TTEntry, TT_EXACT, TT_LOWER
+from .checkers import REPETITION, PLY_LIMIT, DRAW_OFFER_SEARCHES
+from .checkers import WIN_SCORE, move_to_pdn, perft, perft_divide, main
+from .checkers import score_to_tt, score_from_tt
+from .checkers import BoardRenderer, ANSI_CLEAR
+from .checkers import ANSI_SAVE_CURSOR, ANSI_RESTORE_CURSOR
+from .checkers import play_engine_game, run_selfplay, pdn_game_text
+from .checkers import parse_pdn_games, match_pdn_move, read_pdn
+from .checkers import write_pdn_game, validate_pdn_game, validate_archive
+from .checkers import MISSED_JUMP, INCOMPLETE_JUMP, MOVE_AFTER_END
+from .checkers import GameServer, GameLog, Instrumentation
+from .checkers import boards_to_arrays, encode_positions, decode_positions
+from .checkers import decode_positions_numpy, boards_to_codes
+from .checkers import batch_move_masks, DIRECTIONS
+from .checkers import build_tablebase, Tablebase, TBEntry, TB_WIN, TB_LOSS
+from .checkers import build_opening_book, OpeningBook, BookMove
 
 # Constants used in testing the board display functions
 VB = BOX["vb"]  # Vertical bar
@@ -65,7 +89,7 @@ def update_board(board, updates):
     -------------------------
     """
     for index, value in updates:
-        board.squares[index] = value
+        board.set_square(index, value)
 
 
 ###################################
@@ -82,8 +106,18 @@ class TestBoardClass:
         return game_board
 
     def test_get_square_returns_stored_value(self, game_board):
-        game_board.squares[5] = "Doodly doo"
-        assert game_board.get_square(5) == "Doodly doo"
+        game_board.set_square(5, "wk")
+        assert game_board.get_square(5) == "wk"
+
+    def test_squares_only_hold_pieces(self, game_board):
+        with pytest.raises(ValueError):
+            game_board.squares = ["Doodly doo"] * 32
+        with pytest.raises(ValueError):
+            game_board.squares = ["bm"] * 31
+        # The tuple cannot be changed in place
+        with pytest.raises(TypeError):
+            game_board.squares[5] = ""
+        assert game_board.get_square(5) == "bm"
 
     def test_get_square_invalid_index(self, game_board):
         pytest.raises(IndexError, game_board.get_square, 32)
@@ -106,6 +140,30 @@ class TestBoardClass:
         assert stats["bm"] == 11, "incorrect number of black men"
         assert stats[""] == 9, "incorrect number of empty squares"
 
+    def test_get_board_stats_after_capture_and_crowning(self, empty_board):
+        game = Checkers()
+        game.board = empty_board
+        updates = [(17, "bm"), (21, "wm"), (22, "wm")]
+        update_board(empty_board, updates)
+        assert game.validate_pick(17)
+        empty_board.move_piece_to(game, 24)
+        game.switch_turns()
+        game.game_piece_to_move = 22
+        empty_board.move_piece_to(game, 18)
+        game.switch_turns()
+        game.game_piece_to_move = 24
+        empty_board.move_piece_to(game, 28)
+        stats = empty_board.get_board_stats()
+        assert stats == {"bm": 0, "bk": 1, "wm": 1, "wk": 0, "": 30}
+
+    def test_board_stats_are_live_and_read_only(self, game_board):
+        stats = game_board.get_board_stats()
+        assert game_board.get_board_stats() is stats
+        game_board.set_square(5, "")
+        assert stats["bm"] == 11 and stats[""] == 9
+        with pytest.raises(TypeError):
+            stats["bm"] = 12
+
     def test_get_even_row(self, game_board):
         row = 4
         updates = [(13, "bm"), (14, "wk"), (15, "bk")]
@@ -139,6 +197,130 @@ class TestBoardClass:
         assert empty_board.jump_room_exists(8, "NE") is True
         assert empty_board.jump_room_exists(8, "SE") is False
 
+    def test_jump_room_exists_off_board(self, empty_board):
+        assert empty_board.jump_room_exists(3, "SE") is False
+        assert empty_board.jump_room_exists(4, "NW") is False
+        assert empty_board.jump_room_exists(27, "SW") is False
+
+    @pytest.mark.parametrize("square, neighbors, landings", [
+        (0, (None, None, 4, 5), (None, None, None, 9)),
+        (4, (None, 0, None, 8), (None, None, None, 13)),
+        (13, (8, 9, 16, 17), (4, 6, 20, 22)),
+        (31, (26, 27, None, None), (22, None, None, None)),
+    ])
+    def test_diagonal_tables(self, square, neighbors, landings):
+        directions = ("NW", "NE", "SW", "SE")
+        assert tuple(NEIGHBOR_SQ[d][square] for d in directions) == neighbors
+        assert tuple(JUMP_SQ[d][square] for d in directions) == landings
+
+    def test_generate_moves_initial_position(self, game_board):
+        moves = list(game_board.generate_moves(True))
+        assert len(moves) == 7
+        assert all(len(move.path) == 2 and move.captures == ()
+                   for move in moves)
+
+    def test_generate_moves_leaves_board_unchanged(self, empty_board):
+        updates = [(0, "bk"), (4, "wm"), (12, "wm"), (13, "wm")]
+        update_board(empty_board, updates)
+        squares = empty_board.squares
+        moves = empty_board.generate_moves(True)
+        next(moves)
+        # Abandoning the walk part way must restore the board as well
+        moves.close()
+        assert empty_board.squares == squares
+        list(empty_board.generate_moves(True))
+        assert empty_board.squares == squares
+
+    def test_movable_pieces_initial_position(self, game_board):
+        assert game_board.movable_pieces[True] == dict.fromkeys(
+            range(8, 12), False)
+        assert game_board.movable_pieces[False] == dict.fromkeys(
+            range(20, 24), False)
+
+    def test_set_square_updates_movable_pieces(self, empty_board):
+        updates = [(8, "bm"), (13, "wm")]
+        update_board(empty_board, updates)
+        assert empty_board.movable_pieces == {True: {8: True},
+                                              False: {13: True}}
+        # The king on 17 blocks the jump of 8, and 8 blocks the jump of 17
+        empty_board.set_square(17, "bk")
+        assert empty_board.movable_pieces == {True: {8: False, 17: False},
+                                              False: {13: True}}
+
+    def test_make_and_unmake_multi_jump(self, empty_board):
+        updates = [(0, "bm"), (5, "wm"), (14, "wm"), (22, "wm")]
+        update_board(empty_board, updates)
+        squares = empty_board.squares
+        move, = empty_board.generate_moves(True)
+        empty_board.make_move(move)
+        assert empty_board.get_square(25) == "bm"
+        assert empty_board.get_board_stats()["wm"] == 0
+        assert empty_board.movable_pieces == {True: {25: False}, False: {}}
+        empty_board.unmake_move()
+        assert empty_board.squares == squares
+        assert empty_board.get_board_stats()["wm"] == 3
+        assert empty_board.movable_pieces[False] == {5: False, 14: False,
+                                                     22: False}
+
+    def test_make_move_crowns_and_unmake_uncrowns(self, empty_board):
+        update_board(empty_board, [(26, "bm")])
+        empty_board.make_move(Move((26, 31), ()))
+        assert empty_board.get_square(31) == "bk"
+        assert empty_board.get_board_stats()["bk"] == 1
+        empty_board.unmake_move()
+        assert empty_board.get_square(26) == "bm"
+        assert empty_board.get_board_stats()["bk"] == 0
+
+    def test_unmake_move_without_move(self, game_board):
+        pytest.raises(IndexError, game_board.unmake_move)
+
+    def test_zobrist_hash_depends_on_side_to_move(self, game_board):
+        black_hash = game_board.zobrist_hash
+        game_board.blacks_turn = False
+        assert game_board.zobrist_hash != black_hash
+        game_board.blacks_turn = True
+        assert game_board.zobrist_hash == black_hash
+
+    def test_zobrist_hash_of_transposed_positions(self):
+        first, second = Board(), Board()
+        for move in [(8, 12), (20, 16), (9, 13), (21, 17)]:
+            first.make_move(Move(move, ()))
+        for move in [(9, 13), (21, 17), (8, 12), (20, 16)]:
+            second.make_move(Move(move, ()))
+        assert first.squares == second.squares
+        assert first.zobrist_hash == second.zobrist_hash
+        first.unmake_move()
+        assert first.zobrist_hash != second.zobrist_hash
+
+    def test_zobrist_hash_updated_by_move_piece_to(self):
+        game = Checkers()
+        assert game.validate_pick(9)
+        game.board.move_piece_to(game, 13)
+        game.switch_turns()
+        expected = Board()
+        expected.make_move(Move((9, 13), ()))
+        assert game.board.zobrist_hash == expected.zobrist_hash
+
+    def test_fen_round_trip(self):
+        board = Board.from_fen("W:W18,K26:B1-3,K32")
+        assert board.blacks_turn is False
+        assert board.get_square(17) == "wm"
+        assert board.get_square(25) == "wk"
+        assert board.get_square(31) == "bk"
+        assert board.get_board_stats()["bm"] == 3
+        assert board.to_fen() == "W:W18,K26:B1,2,3,K32"
+        assert Board.from_fen(Board().to_fen()).squares == Board().squares
+
+    @pytest.mark.parametrize("fen", ["", "B:W1", "X:W1:B2", "B:W33:B1",
+                                     "B:Wa:B1"])
+    def test_from_fen_invalid(self, fen):
+        pytest.raises(ValueError, Board.from_fen, fen)
+
+    def test_captured_square_table(self):
+        assert CAPTURED_SQ[8, 17] == 13
+        assert CAPTURED_SQ[13, 4] == 8
+        assert (8, 10) not in CAPTURED_SQ
+
 
 ###################################
 # #### Checkers class tests
@@ -298,4 +480,1099 @@ class TestCheckersClass:
         emptygame.blacks_turn = False
         assert emptygame.get_available_moves() == [(21, True), (24, False)]
 
+    def test_get_available_moves_after_jump(self, emptygame):
+        updates = [(8, "bm"), (13, "wm"), (22, "wm"), (24, "wm")]
+        update_board(emptygame.board, updates)
+        assert emptygame.validate_pick(8)
+        emptygame.board.move_piece_to(emptygame, 17)
+        assert emptygame.get_available_moves() == [(17, True)]
+        assert emptygame.turn_is_complete(17) is False
+        emptygame.switch_turns()
+        assert emptygame.get_available_moves() == [(22, True), (24, False)]
+
     # Need to add comprehensive coverage of get_available_moves()
+
+    def test_get_legal_moves_multi_jump_branches(self, emptygame):
+        updates = [(0, "bm"), (5, "wm"), (13, "wm"), (14, "wm"), (22, "wm")]
+        update_board(emptygame.board, updates)
+        assert sorted(emptygame.get_legal_moves()) == [
+            ((0, 9, 16), (5, 13)),
+            ((0, 9, 18, 25), (5, 14, 22)),
+        ]
+
+    def test_get_legal_moves_jump_is_mandatory(self, emptygame):
+        updates = [(9, "bm"), (13, "wm"), (10, "bm")]
+        update_board(emptygame.board, updates)
+        assert emptygame.get_legal_moves() == [((9, 16), (13,))]
+
+    def test_get_legal_moves_jump_into_kings_row_ends_turn(self, emptygame):
+        updates = [(21, "bk"), (25, "wm"), (26, "wm")]
+        update_board(emptygame.board, updates)
+        # The king could go on to jump 26 from 30, but landing in the kings
+        # row ends the turn
+        assert emptygame.get_legal_moves() == [((21, 30), (25,))]
+
+
+###################################
+# #### Game class tests
+###################################
+class TestGameClass:
+    @pytest.fixture()
+    def game(self):
+        return Game()
+
+    def test_apply_move_passes_turn(self, game):
+        move = game.apply_move([8, 12])
+        assert move == Move((8, 12), ())
+        assert game.blacks_turn is False
+        assert game.history == [move]
+        assert game.board.get_square(12) == "bm"
+
+    def test_apply_move_illegal(self, game):
+        with pytest.raises(IllegalMoveError):
+            game.apply_move([8, 17])
+        assert game.is_legal([8, 13]) is True
+        assert game.is_legal([20, 16]) is False
+        assert game.history == []
+
+    def test_apply_move_detects_win(self, game):
+        game.board = Board.from_fen("B:W14:B10")
+        game.apply_move([9, 16])
+        assert game.is_over
+        assert game.result == BLACK_WINS
+        with pytest.raises(IllegalMoveError):
+            game.apply_move([16, 20])
+
+    def test_hop_by_hop_move_is_recorded(self, game):
+        game.board = Board.from_fen("B:W6,15:B1")
+        assert game.validate_pick(0)
+        game.move_piece_to(9)
+        assert game.turn_is_complete(9) is False
+        game.game_piece_to_move = 9
+        assert game.validate_move_to(18)
+        game.move_piece_to(18)
+        assert game.turn_is_complete(18)
+        game.end_turn()
+        assert game.history == [Move((0, 9, 18), (5, 14))]
+        assert game.result == BLACK_WINS
+
+    def test_resign_and_draw(self, game):
+        game.resign()
+        assert game.result == WHITE_WINS
+        other = Game()
+        other.agree_draw()
+        assert other.result == DRAW
+
+    def test_draw_by_repetition(self, game):
+        shuffle = [[0, 4], [31, 27], [4, 0], [27, 31]] * 2
+        game.board = Board.from_fen("B:WK32:BK1")
+        for path in shuffle:
+            game.apply_move(path)
+        # Without the draw rules the game goes on
+        assert not game.is_over
+        game = Game(repetitions=3)
+        game.board = Board.from_fen("B:WK32:BK1")
+        for path in shuffle[:-1]:
+            game.apply_move(path)
+        assert not game.is_over
+        game.apply_move(shuffle[-1])
+        assert (game.result, game.termination) == (DRAW, REPETITION)
+
+    def test_draw_by_ply_limit(self):
+        game = Game(max_plies=2)
+        game.apply_move([8, 12])
+        assert not game.is_over
+        game.apply_move([21, 17])
+        assert (game.result, game.termination) == (DRAW, PLY_LIMIT)
+
+
+###################################
+# #### BitBoard class tests
+###################################
+class TestBitBoardClass:
+    @pytest.fixture()
+    def bitboard(self):
+        return BitBoard()
+
+    def test_initial_position_matches_board(self, bitboard):
+        assert bitboard.squares == Board().squares
+
+    def test_get_square_invalid_index(self, bitboard):
+        pytest.raises(IndexError, bitboard.get_square, 32)
+
+    def test_from_board_round_trip(self):
+        board = Board()
+        updates = [(7, ""), (9, ""), (15, "wk"), (19, "bm"), (21, "bk")]
+        update_board(board, updates)
+        bitboard = BitBoard.from_board(board)
+        assert bitboard.squares == board.squares
+        assert bitboard.to_board().squares == board.squares
+
+    def test_get_board_stats(self):
+        board = Board()
+        updates = [(7, ""), (9, ""), (15, "wk"), (19, "bm"), (21, "")]
+        update_board(board, updates)
+        assert BitBoard.from_board(board).get_board_stats() == \
+            board.get_board_stats()
+
+    def test_side_moves_initial_position(self, bitboard):
+        assert bitboard.side_moves(True) == [
+            (8, 12), (8, 13), (9, 13), (9, 14), (10, 14), (10, 15), (11, 15)
+        ]
+        assert bitboard.side_moves(False) == [
+            (20, 16), (21, 16), (21, 17), (22, 17), (22, 18), (23, 18),
+            (23, 19)
+        ]
+
+    def test_side_jumps_men_and_kings(self):
+        board = Board()
+        board.squares = ["" for _ in range(32)]
+        updates = [(8, "bm"), (13, "wm"), (17, "bk"), (21, "wm")]
+        update_board(board, updates)
+        bitboard = BitBoard.from_board(board)
+        # The man on 8 and the king on 17 block each other's jump over 13
+        assert bitboard.side_jumps(True) == [(17, 21, 24)]
+        assert bitboard.side_jumps(False) == [(13, 8, 4), (21, 17, 14)]
+
+    def test_get_available_moves_matches_checkers(self):
+        game = Checkers()
+        game.board.squares = ["" for _ in range(32)]
+        updates = [(16, "bk"), (21, "wm"), (24, "wk"), (28, "bk")]
+        update_board(game.board, updates)
+        game.blacks_turn = False
+        bitboard = BitBoard.from_board(game.board)
+        assert bitboard.get_available_moves(False) == \
+            game.get_available_moves()
+
+    def test_moves_match_board_in_random_games(self):
+        rng = random.Random(7)
+        for _ in range(10):
+            game = Game()
+            while not game.is_over and len(game.history) < 150:
+                board = game.board
+                side = board.blacks_turn
+                bitboard = BitBoard.from_board(board)
+                own = [sq for sq in range(32) if board.side_of(sq) is side]
+                assert bitboard.get_available_moves(side) == \
+                    game.get_available_moves()
+                assert bitboard.side_moves(side) == sorted(
+                    (sq, to) for sq in own for to in board.valid_moves(sq))
+                assert bitboard.side_jumps(side) == sorted(
+                    (sq, CAPTURED_SQ[sq, to], to)
+                    for sq in own for to in board.valid_jumps(sq))
+                game.apply_move(rng.choice(game.get_legal_moves()))
+
+
+###################################
+# #### TranspositionTable class tests
+###################################
+class TestTranspositionTableClass:
+    def test_size_is_power_of_two_within_budget(self):
+        table = TranspositionTable(size_mb=3)
+        assert table.size == 2**17
+        assert len(table.keys) == len(table.data) == table.size
+
+    def test_invalid_policy(self):
+        pytest.raises(ValueError, TranspositionTable, 1, "never")
+
+    def test_store_and_probe(self):
+        table = TranspositionTable(size_mb=1)
+        key = Board().zobrist_hash
+        assert table.probe(key) is None
+        table.store(key, 5, TT_EXACT, -250, (8, 13))
+        assert table.probe(key) == TTEntry(5, TT_EXACT, -250, (8, 13))
+        stats = table.get_stats()
+        assert (stats["probes"], stats["hits"], stats["misses"]) == (2, 1, 1)
+
+    @pytest.mark.parametrize("policy, first, second", [
+        ("always", None, TTEntry(1, TT_LOWER, 7, None)),
+        ("depth", TTEntry(4, TT_EXACT, 3, (9, 13)), None),
+        ("two-tier", TTEntry(4, TT_EXACT, 3, (9, 13)),
+         TTEntry(1, TT_LOWER, 7, None)),
+    ])
+    def test_replacement_policy(self, policy, first, second):
+        table = TranspositionTable(size_mb=1, policy=policy)
+        # Two keys mapping to the same slot
+        table.store(6, 4, TT_EXACT, 3, (9, 13))
+        table.store(6 + table.size, 1, TT_LOWER, 7)
+        assert table.probe(6) == first
+        assert table.probe(6 + table.size) == second
+
+    def test_collisions_counted(self):
+        table = TranspositionTable(size_mb=1, policy="always")
+        table.store(6, 4, TT_EXACT, 3)
+        assert table.probe(6 + table.size) is None
+        assert table.get_stats()["collisions"] == 1
+        table.clear()
+        assert table.filled == 0
+
+
+###################################
+# #### AIPlayer class tests
+###################################
+class TestAIPlayerClass:
+    @pytest.fixture()
+    def player(self):
+        return AIPlayer(time_limit=None, max_depth=4, tt_size_mb=1,
+                        verbose=False)
+
+    @pytest.fixture()
+    def empty_board(self):
+        board = Board()
+        board.squares = ["" for _ in range(32)]
+        return board
+
+    def test_search_leaves_board_unchanged(self, player):
+        board = Board()
+        result = player.search(board)
+        assert board.squares == Board().squares
+        assert board.zobrist_hash == Board().zobrist_hash
+        assert result.depth == 4
+        assert result.pv[0] == result.move
+        assert result.move in board.generate_moves()
+
+    def test_search_finds_winning_capture(self, player, empty_board):
+        updates = [(9, "bk"), (13, "wm"), (2, "bm")]
+        update_board(empty_board, updates)
+        result = player.search(empty_board)
+        assert result.move == Move((9, 16), (13,))
+        assert result.score == WIN_SCORE - 1
+
+    def test_search_without_moves(self, player, empty_board):
+        update_board(empty_board, [(28, "wm")])
+        assert player.search(empty_board) is None
+
+    def test_node_limit_stops_deepening(self):
+        player = AIPlayer(time_limit=None, node_limit=200, tt_size_mb=1,
+                          verbose=False)
+        result = player.search(Board())
+        assert 1 <= result.depth < 64
+        assert result.nodes <= 200 or result.depth == 1
+
+    def test_move_ordering(self, player):
+        moves = list(Board().generate_moves())
+        # 9-13, 9-14, 10-14, 10-15, 11-15, 11-16, 12-16
+        player._history[10 * 32 + 15] = 5
+        player._history[8 * 32 + 12] = 9
+        player._killers = [[], [(9, 13)]]
+        player._order_moves(moves, (11, 15), 1)
+        assert [move_to_pdn(move) for move in moves[:4]] == \
+            ["12-16", "10-14", "9-13", "11-16"]
+        jumps = [Move((0, 9), (5,)), Move((1, 10, 19), (6, 15))]
+        player._order_moves(jumps, None, 0)
+        assert jumps[0].path == (1, 10, 19)
+
+    def test_move_ordering_keeps_scores(self, player):
+        board = Board.from_fen("W:W21,22,24,25,28,29:B1,2,5,7,10,11,14")
+        result = player.search(board)
+        assert player.cutoffs > 0
+        assert 0 < player.first_move_cutoff_rate <= 1
+        # Cutoffs at a ply whose positions have a single move
+        assert AIPlayer(time_limit=None, max_depth=3, verbose=False).search(
+            Board.from_fen("W:W8:B6,25,K30")) is not None
+        unordered = AIPlayer(time_limit=None, max_depth=4, tt_size_mb=1,
+                             verbose=False, move_ordering=False)
+        assert unordered.search(board).score == result.score
+
+    def test_quiescence_resolves_exchanges(self):
+        board = Board.from_fen("B:WK18,21,29:B5,10,19")
+        plain = AIPlayer(time_limit=None, max_depth=1, verbose=False,
+                         quiescence=False)
+        result = plain.search(board)
+        assert move_to_pdn(result.move) == "5-9"
+        assert result.qnodes == 0
+        player = AIPlayer(time_limit=None, max_depth=1, verbose=False)
+        result = player.search(board)
+        assert [move_to_pdn(move) for move in result.pv] == \
+            ["10-14", "18x9", "5x14"]
+        assert result.score == 0
+        assert result.qnodes > 0 and result.nodes < result.qnodes
+        # The exchange wins the last black piece
+        result = player.search(Board.from_fen("W:W5,K6,K9,21,22:BK23"))
+        assert [move_to_pdn(move) for move in result.pv] == \
+            ["22-18", "23x14", "9x18"]
+        assert result.score == WIN_SCORE - 3
+
+    def test_win_scores_kept_between_searches(self, player):
+        board = Board.from_fen("W:WK1,22,23,24,27,31:B8,18")
+        result = player.search(board)
+        assert result.score == WIN_SCORE - 5
+        board.make_move(result.move)
+        # The table holds entries stored at other plies of the last search
+        assert player.search(board).score == 4 - WIN_SCORE
+        assert score_to_tt(WIN_SCORE - 5, 2) == WIN_SCORE - 3
+        assert score_from_tt(WIN_SCORE - 3, 2) == WIN_SCORE - 5
+        assert score_to_tt(-150, 2) == score_from_tt(-150, 2) == -150
+
+    def test_move_to_pdn(self):
+        assert move_to_pdn(Move((8, 12), ())) == "9-13"
+        assert move_to_pdn(Move((0, 9, 18), (5, 14))) == "1x10x19"
+
+    def test_play_game_against_computer(self, player):
+        game = Checkers()
+        with patch('builtins.input', side_effect=['Rob', 'r']), \
+                patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            play_game(game, black_player=player)
+        captured_output = mock_stdout.getvalue()
+        assert game.black_name == "Computer"
+        assert game.white_name == "Rob"
+        assert game.board.squares != Board().squares, \
+            "computer did not make its move"
+        assert "Rob has resigned" in captured_output
+
+    def test_draw_offer_when_level(self, player):
+        game = Checkers()
+        player._level_searches = DRAW_OFFER_SEARCHES
+        assert player.get_player_move_from(game) == 'd'
+        # Declined offers are not repeated on the next call
+        assert player.get_player_move_from(game) in ('9', '10', '11', '12')
+
+    def test_computer_games_end(self):
+        players = [AIPlayer(name=name, time_limit=None, max_depth=2,
+                            tt_size_mb=1, verbose=False)
+                   for name in ("Black", "White")]
+        game = Checkers(max_plies=40, repetitions=3)
+        with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            play_game(game, *players)
+        assert game.is_over
+        assert "Good bye!" in mock_stdout.getvalue()
+
+
+###################################
+# #### Perft tests
+###################################
+class TestPerft:
+    @pytest.mark.parametrize("depth, nodes", [
+        (0, 1), (1, 7), (2, 49), (3, 302), (4, 1469), (5, 7361)
+    ])
+    def test_perft_initial_position(self, depth, nodes):
+        board = Board()
+        assert perft(board, depth) == nodes
+        assert board.squares == Board().squares
+
+    def test_perft_multi_jump_branches(self):
+        # Black must jump, and may continue after 10x19 in two ways
+        board = Board.from_fen("B:W14,15,23,24,27:B10")
+        assert sorted(move_to_pdn(move) for move, _ in
+                      perft_divide(board, 1)) == [
+            "10x17", "10x19x26", "10x19x28"]
+
+    def test_perft_divide_sums_to_perft(self):
+        board = Board()
+        assert sum(nodes for _, nodes in perft_divide(board, 4)) == \
+            perft(board, 4)
+
+    def test_main_perft(self):
+        with patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            main(["--perft", "3", "--divide"])
+        captured_output = mock_stdout.getvalue()
+        assert "depth  3:          302 nodes" in captured_output
+        assert "Divide at depth 3:" in captured_output
+
+
+###################################
+# #### BoardRenderer class tests
+###################################
+class TerminalOutput(StringIO):
+    """Output stream posing as a terminal"""
+    def isatty(self):
+        return True
+
+    def fileno(self):
+        return 1
+
+
+def terminal_size(lines):
+    """Patch the size of the terminal to 80 columns by lines"""
+    return patch('os.get_terminal_size',
+                 return_value=os.terminal_size((80, lines)))
+
+
+class TestBoardRendererClass:
+    @pytest.fixture()
+    def game(self):
+        return Checkers('Kat', 'Rob')
+
+    def test_non_terminal_gets_full_board(self, game):
+        output = StringIO()
+        renderer = BoardRenderer(output)
+        renderer.draw(game.board, game)
+        renderer.draw(game.board, game)
+        captured_output = output.getvalue()
+        assert ANSI_CLEAR not in captured_output
+        assert captured_output.count("Black: Kat") == 2
+        assert captured_output.count(PDN8) == 2
+
+    def test_terminal_redraws_changed_rows_only(self, game):
+        output = TerminalOutput()
+        renderer = BoardRenderer(output)
+        with terminal_size(26):
+            renderer.draw(game.board, game)
+            first_draw = output.getvalue()
+            assert first_draw.startswith(ANSI_CLEAR)
+            assert first_draw.endswith(ANSI_SAVE_CURSOR)
+            assert "White: Rob" in first_draw
+            game.apply_move([8, 12])
+            output.seek(0)
+            output.truncate()
+            renderer.draw(game.board, game)
+        second_draw = output.getvalue()
+        assert ANSI_CLEAR not in second_draw
+        assert "Black: Kat" not in second_draw
+        assert PDN3 in second_draw and PDN4 in second_draw
+        assert PDN1 not in second_draw and PDN5 not in second_draw
+        # The prompts of the next turn start where those of the last did
+        assert ANSI_RESTORE_CURSOR in second_draw
+
+    def test_terminal_full_redraw_on_name_change(self, game):
+        output = TerminalOutput()
+        renderer = BoardRenderer(output)
+        with terminal_size(26):
+            renderer.draw(game.board, game)
+            game.white_name = 'Bob'
+            renderer.draw(game.board, game)
+        assert output.getvalue().count(ANSI_CLEAR) == 2
+
+    def test_small_terminal_gets_full_board(self, game):
+        output = TerminalOutput()
+        renderer = BoardRenderer(output)
+        # The prompts below the board would scroll an 80x24 terminal
+        with terminal_size(24):
+            renderer.draw(game.board, game)
+            game.apply_move([8, 12])
+            renderer.draw(game.board, game)
+        captured_output = output.getvalue()
+        assert captured_output.count(ANSI_CLEAR) == 2
+        assert captured_output.count("Black: Kat") == 2
+        assert ANSI_RESTORE_CURSOR not in captured_output
+
+
+###################################
+# #### Self-play tests
+###################################
+class TestSelfPlay:
+    @pytest.fixture()
+    def player(self):
+        return AIPlayer(time_limit=None, max_depth=2, tt_size_mb=1,
+                        verbose=False)
+
+    def test_play_engine_game_record(self, player):
+        record = play_engine_game(player, max_plies=6, random_plies=2,
+                                  seed=1)
+        assert record["start"] == Board().to_fen()
+        assert record["plies"] == len(record["moves"]) == 6
+        assert (record["result"], record["termination"]) == \
+            (DRAW, "ply limit")
+
+    def test_play_engine_game_from_position(self, player):
+        record = play_engine_game(player, start_fen="W:W18:B15")
+        assert record["moves"] == ["18x11"]
+        assert (record["result"], record["termination"]) == \
+            (WHITE_WINS, "win")
+
+    def test_pdn_game_text(self):
+        text = pdn_game_text([("Result", DRAW), ("FEN", "W:W18:B14")],
+                             ["18-15", "14-17", "15-11"], DRAW)
+        assert text == ('[Result "1/2-1/2"]\n[FEN "W:W18:B14"]\n\n'
+                        '1... 18-15 2. 14-17 15-11 1/2-1/2\n\n')
+
+    def test_run_selfplay_streams_records(self, tmpdir):
+        output = str(tmpdir.join("games.jsonl"))
+        summary = run_selfplay(2, output, processes=1, time_limit=None,
+                               max_depth=1, max_plies=4)
+        with open(output) as stream:
+            records = [json.loads(line) for line in stream]
+        assert sorted(record["game"] for record in records) == [1, 2]
+        assert summary["games"] == 2
+        assert summary["results"][DRAW] == 2
+
+    def test_run_selfplay_writes_pdn(self, tmpdir):
+        output = str(tmpdir.join("games.pdn"))
+        run_selfplay(2, output, processes=1, time_limit=None, max_depth=1,
+                     max_plies=4)
+        with open(output) as stream:
+            games = list(read_pdn(stream))
+        assert len(games) == 2
+        for pdn_game in games:
+            assert pdn_game.error is None
+            assert pdn_game.tags["Event"] == "Self-play"
+            assert len(pdn_game.game.history) == 4
+            assert pdn_game.game.result == DRAW
+
+
+###################################
+# #### PDN tests
+###################################
+class TestPdn:
+    ARCHIVE = (
+        '[Event "Test"]\n[Black "Ann"]\n[White "Bob"]\n'
+        '1. 11-15 {a comment\nover two lines} 22-18 (2. 9-13) 2. 15x22!\n'
+        '$1 25x18 ; rest of the line\n3. 12-16 0-1\n\n'
+        '[FEN "W:W18:B15"] 1... 18x11 *\n'
+        '1. 9-14 9-13 1-0\n'
+    )
+
+    def test_parse_pdn_games(self):
+        games = list(parse_pdn_games(StringIO(self.ARCHIVE)))
+        assert games == [
+            ({"Event": "Test", "Black": "Ann", "White": "Bob"},
+             ["11-15", "22-18", "15x22", "25x18", "12-16"], "0-1"),
+            ({"FEN": "W:W18:B15"}, ["18x11"], "*"),
+            ({}, ["9-14", "9-13"], "1-0"),
+        ]
+
+    def test_parse_pdn_games_streams(self):
+        def lines():
+            yield '[Round "1"]\n1. 9-13 *\n'
+            raise AssertionError("read past the first game")
+        tags, moves, result = next(parse_pdn_games(lines()))
+        assert (tags, moves, result) == ({"Round": "1"}, ["9-13"], "*")
+
+    def test_match_pdn_move(self):
+        game = Game()
+        game.board = Board.from_fen("B:W6,7,14,15:B1")
+        assert match_pdn_move(game, "1x10x19").path == (0, 9, 18)
+        # Jumps can be given by their first and last squares only
+        assert match_pdn_move(game, "1x19").path == (0, 9, 18)
+        pytest.raises(IllegalMoveError, match_pdn_move, game, "1-5")
+        pytest.raises(IllegalMoveError, match_pdn_move, game, "1x")
+
+    def test_read_pdn(self):
+        games = list(read_pdn(StringIO(self.ARCHIVE)))
+        assert [pdn_game.error for pdn_game in games] == \
+            [None, None, "ply 2: illegal move: 9-13"]
+        first, second = games[0].game, games[1].game
+        assert (first.black_name, first.white_name) == ("Ann", "Bob")
+        assert len(first.history) == 5
+        # The recorded result stands for a game that was resigned
+        assert first.result == WHITE_WINS
+        assert second.result == WHITE_WINS
+        assert len(games[2].game.history) == 1
+
+    def test_write_pdn_game_round_trip(self):
+        game = Game("Ann", "Bob")
+        game.board = Board.from_fen("W:W18,22:B14,15")
+        game.apply_move(Move((17, 10), (13,)))
+        stream = StringIO()
+        write_pdn_game(stream, game, [("Event", "Test")])
+        assert stream.getvalue().startswith(
+            '[Black "Ann"]\n[White "Bob"]\n[Result "*"]\n'
+            '[Event "Test"]\n[FEN "W:W18,22:B14,15"]\n')
+        stream.seek(0)
+        pdn_game, = read_pdn(stream)
+        assert pdn_game.error is None
+        assert pdn_game.game.board.to_fen() == game.board.to_fen()
+
+
+###################################
+# #### Archive validation tests
+###################################
+class TestValidation:
+    @pytest.mark.parametrize("tags, moves, plies, kind", [
+        ({}, ["11-15", "22-18", "15x22", "25x18"], 4, None),
+        # Another piece must jump
+        ({}, ["11-15", "22-18", "12-16"], 2, MISSED_JUMP),
+        # The piece itself must jump
+        ({}, ["11-15", "22-18", "15-19"], 2, MISSED_JUMP),
+        ({"FEN": "B:W6,7,14,15:B1"}, ["1x10"], 0, INCOMPLETE_JUMP),
+        ({"FEN": "B:W6,7,14,15:B1"}, ["1x19"], 1, None),
+        ({"FEN": "W:W18:B15"}, ["18x11", "1-5"], 1, MOVE_AFTER_END),
+    ])
+    def test_validate_pdn_game(self, tags, moves, plies, kind):
+        report = validate_pdn_game(tags, moves)
+        assert report["plies"] == plies
+        if kind is None:
+            assert report["error"] is None
+        else:
+            assert report["error"]["kind"] == kind
+            assert report["error"]["ply"] == plies + 1
+
+    def test_validate_archive(self, tmpdir):
+        archive = tmpdir.join("games.pdn")
+        archive.write("1. 11-15 22-18 2. 15x22 25x18 *\n"
+                      "1. 11-15 22-18 2. 12-16 *\n"
+                      '[FEN "B:W6,7,14,15:B1"] 1. 1x10 *\n')
+        output = StringIO()
+        summary = validate_archive(str(archive), output, processes=1)
+        assert (summary["games"], summary["invalid"]) == (3, 2)
+        assert summary["errors"] == {MISSED_JUMP: 1, INCOMPLETE_JUMP: 1}
+        reports = [json.loads(line) for line in
+                   output.getvalue().splitlines()]
+        assert [report["game"] for report in reports] == [2, 3]
+
+
+###################################
+# #### Game server tests
+###################################
+class TestGameServer:
+    START_FEN = "B:W21,22,23,24,25,26,27,28,29,30,31,32:" \
+        "B1,2,3,4,5,6,7,8,9,10,11,12"
+
+    @staticmethod
+    def run_clients(scenario, log=None):
+        """Run scenario(server, connect) against a local GameServer"""
+        async def main():
+            server = GameServer(log)
+            tcp_server = await server.start()
+            port = tcp_server.sockets[0].getsockname()[1]
+
+            async def connect():
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", port)
+
+                async def ask(line, answers=1):
+                    writer.write(line.encode() + b"\n")
+                    await writer.drain()
+                    return await read(answers)
+
+                async def read(answers=1):
+                    return [(await reader.readline()).decode().rstrip()
+                            for _ in range(answers)]
+                return ask, read, writer
+            try:
+                await scenario(server, connect)
+            finally:
+                tcp_server.close()
+                await tcp_server.wait_closed()
+        asyncio.run(main())
+
+    def test_two_clients_play(self):
+        async def scenario(server, connect):
+            ask1, read1, _ = await connect()
+            ask2, read2, _ = await connect()
+            assert await ask1("NEW Ann") == ["GAME 1 black"]
+            assert await ask1("MOVE 9-14") == \
+                ["ERROR waiting for an opponent"]
+            assert await ask2("JOIN 1 Bob", 3) == [
+                "GAME 1 white", "START Ann Bob", "BOARD " + self.START_FEN]
+            assert await read1(2) == ["START Ann Bob",
+                                      "BOARD " + self.START_FEN]
+            assert await ask2("MOVE 22-18") == ["ERROR not your turn"]
+            assert await ask1("MOVE 9-10") == ["ERROR illegal move: 9-10"]
+            assert (await ask1("MOVE 9-14", 2))[0] == "MOVED 9-14"
+            assert (await read2(2))[0] == "MOVED 9-14"
+            assert await ask2("MOVES") == \
+                ["MOVES 21-17 22-18 22-17 23-19 23-18 24-20 24-19"]
+            assert await ask2("RESIGN") == ["RESULT 1-0"]
+            assert await read1() == ["RESULT 1-0"]
+            assert server.sessions == {}
+            assert await ask1("QUIT") == ["BYE"]
+        self.run_clients(scenario)
+
+    def test_leaving_resigns_the_game(self):
+        async def scenario(server, connect):
+            ask1, read1, _ = await connect()
+            ask2, read2, writer2 = await connect()
+            await ask1("NEW")
+            await ask2("JOIN 1", 3)
+            await read1(2)
+            assert await ask2("JOIN 1") == ["ERROR already in game 1"]
+            writer2.close()
+            assert await read1() == ["RESULT 1-0"]
+            assert await ask1("BOGUS") == ["ERROR unknown command: BOGUS"]
+        self.run_clients(scenario)
+
+    def test_many_sessions(self):
+        async def scenario(server, connect):
+            clients = [await connect() for _ in range(100)]
+            for number, (ask, _, _) in enumerate(clients, 1):
+                assert await ask("NEW") == ["GAME {} black".format(number)]
+            assert len(server.sessions) == 100
+        self.run_clients(scenario)
+
+
+###################################
+# #### Move log tests
+###################################
+class TestGameLog:
+    # 1. 11-15 22-18 2. 15x22
+    MOVES = [Move((10, 14), ()), Move((21, 17), ()), Move((14, 21), (17,))]
+
+    @pytest.fixture()
+    def log_path(self, tmpdir):
+        return str(tmpdir.join("games.log"))
+
+    def test_recover_replays_flushed_moves(self, log_path):
+        log = GameLog(log_path, batch_size=3, max_delay=60, fsync=False)
+        game = Game("Ann", "Bob")
+        log.start_game(7, game)
+        for move in self.MOVES:
+            game.apply_move(move)
+            log.log_move(7, move)
+        # The last move is still buffered when the process dies
+        log.wait()
+        recovered = GameLog(log_path).recover()
+        assert list(recovered) == [7]
+        assert (recovered[7].black_name, recovered[7].white_name) == \
+            ("Ann", "Bob")
+        assert recovered[7].history == self.MOVES[:2]
+        log.close()
+        recovered = GameLog(log_path).recover()
+        assert recovered[7].board.to_fen() == game.board.to_fen()
+        assert recovered[7].board.zobrist_hash == game.board.zobrist_hash
+
+    def test_writes_do_not_block_logging(self, log_path):
+        written = threading.Event()
+        log = GameLog(log_path, batch_size=1, snapshot_every=2)
+        # The disk is stuck until every move has been logged
+        with patch("os.fsync", side_effect=lambda fd: written.wait(5)):
+            start = time.perf_counter()
+            game = Game()
+            log.start_game(1, game)
+            for move in self.MOVES:
+                game.apply_move(move)
+                log.log_move(1, move)
+            assert time.perf_counter() - start < 1
+            written.set()
+            log.close()
+        assert GameLog(log_path).recover()[1].history == self.MOVES[2:]
+
+    def test_recover_cuts_off_torn_record(self, log_path):
+        log = GameLog(log_path, fsync=False)
+        log.start_game(1, Game())
+        log.log_move(1, self.MOVES[0])
+        log.close()
+        with open(log_path, "ab") as stream:
+            stream.write(b"\x02\x01\x00")
+        recovered = GameLog(log_path).recover()
+        assert recovered[1].history == self.MOVES[:1]
+        # New records follow the last complete one
+        log = GameLog(log_path, fsync=False)
+        log.log_move(1, self.MOVES[1])
+        log.close()
+        assert GameLog(log_path).recover()[1].history == self.MOVES[:2]
+
+    def test_recover_from_snapshot(self, log_path):
+        log = GameLog(log_path, fsync=False, snapshot_every=2)
+        games = {1: Game("Ann", "Bob"), 2: Game("Cid", "Dee")}
+        for number, game in games.items():
+            log.start_game(number, game)
+        for move in self.MOVES:
+            games[1].apply_move(move)
+            log.log_move(1, move)
+        games[2].resign()
+        log.end_game(2, games[2].result)
+        log.close()
+        recovered = GameLog(log_path).recover()
+        assert list(recovered) == [1]
+        # Only the move after the snapshot is replayed
+        assert recovered[1].history == self.MOVES[2:]
+        assert recovered[1].board.to_fen() == games[1].board.to_fen()
+        assert recovered[1].black_name == "Ann"
+
+    def test_recover_names(self, log_path):
+        log = GameLog(log_path, fsync=False, snapshot_every=1)
+        names = [("\u00e9" * 127, "a\0b"), ("\0", "\u00e9\0\u00e9")]
+        log.start_game(1, Game(*names[0]))
+        # The snapshot holds the first game and the log the second
+        log.log_move(1, self.MOVES[0])
+        log.start_game(2, Game(*names[1]))
+        with pytest.raises(ValueError):
+            log.start_game(3, Game("\u00e9" * 128, "Bob"))
+        log.close()
+        recovered = GameLog(log_path).recover()
+        assert [(game.black_name, game.white_name)
+                for game in recovered.values()] == names
+
+    def test_server_recovers_games(self, log_path):
+        async def play(server, connect):
+            ask1, read1, _ = await connect()
+            ask2, read2, _ = await connect()
+            await ask1("NEW Ann")
+            await ask2("JOIN 1 Bob", 3)
+            await read1(2)
+            await ask1("MOVE 9-14", 2)
+            server.log.flush()
+            server.log.wait()
+
+        async def rejoin(server, connect):
+            ask, read, _ = await connect()
+            assert await ask("JOIN 1", 3) == [
+                "GAME 1 black", "START Ann Bob",
+                "BOARD W:W21,22,23,24,25,26,27,28,29,30,31,32:"
+                "B1,2,3,4,5,6,7,8,10,11,12,14"]
+        TestGameServer.run_clients(play, GameLog(log_path, fsync=False))
+        TestGameServer.run_clients(rejoin, GameLog(log_path, fsync=False))
+
+    def test_server_recovers_hostile_names(self, log_path):
+        async def play(server, connect):
+            ask1, read1, _ = await connect()
+            ask2, read2, _ = await connect()
+            assert await ask1("NEW " + "\u00e9" * 200) == \
+                ["ERROR name longer than 255 bytes"]
+            await ask1("NEW a\0b")
+            assert await ask2("JOIN 1 " + "x" * 65000) == \
+                ["ERROR name longer than 255 bytes"]
+            await ask2("JOIN 1 \u00e9\0", 3)
+            server.log.flush()
+            server.log.wait()
+
+        async def rejoin(server, connect):
+            ask, read, _ = await connect()
+            assert (await ask("JOIN 1", 3))[1] == "START a\0b \u00e9\0"
+        TestGameServer.run_clients(play, GameLog(log_path, fsync=False))
+        TestGameServer.run_clients(rejoin, GameLog(log_path, fsync=False))
+
+
+###################################
+# #### Instrumentation tests
+###################################
+class TestInstrumentation:
+    @pytest.fixture()
+    def instrumentation(self):
+        instrumentation = Instrumentation()
+        instrumentation.enable()
+        yield instrumentation
+        instrumentation.disable()
+
+    def test_disabled_leaves_methods_alone(self):
+        valid_moves = Board.valid_moves
+        instrumentation = Instrumentation()
+        instrumentation.enable()
+        assert instrumentation.enabled
+        assert Board.valid_moves is not valid_moves
+        instrumentation.disable()
+        assert not instrumentation.enabled
+        assert Board.valid_moves is valid_moves
+
+    def test_counts_per_turn_and_game(self, instrumentation):
+        game = Game()
+        game.board = Board.from_fen("B:W6,7,15:B1")
+        # Black jumps 1x10x19 hop by hop
+        assert game.validate_pick(0)
+        for square in (9, 18):
+            assert game.validate_move_to(square)
+            game.move_piece_to(square)
+            if game.turn_is_complete(square):
+                break
+            game.game_piece_to_move = square
+        game.end_turn()
+        turn, = instrumentation.get_stats()["turns"]
+        assert turn["move"] == "1x10x19"
+        assert turn["calls"]["move_piece_to"]["calls"] == 2
+        assert turn["calls"]["valid_jumps"]["calls"] == 2
+        assert turn["calls"]["get_available_moves"]["calls"] == 1
+        game.apply_move(Move((6, 2), ()))
+        stats = instrumentation.get_stats()
+        assert stats["game"]["move_piece_to"]["calls"] == 2
+        assert stats["turn"] == {}
+        assert len(stats["turns"]) == 2
+
+    def test_game_end_and_dump(self, instrumentation):
+        game = Game()
+        game.board = Board.from_fen("W:W18:B15")
+        game.get_available_moves()
+        game.apply_move(Move((17, 10), (13,)))
+        stats = instrumentation.get_stats()
+        calls = {"get_available_moves": {
+            "calls": 1,
+            "seconds": stats["games"][0]["calls"]["get_available_moves"]
+            ["seconds"]}}
+        assert stats["games"] == [{
+            "plies": 1, "result": WHITE_WINS, "calls": calls,
+            "turns": [{"ply": 1, "move": "18x11", "calls": calls}]}]
+        assert stats["turns"] == [] and stats["game"] == {}
+        # Showing the final board counts toward the last turn
+        game.board.display_board(game)
+        stream = StringIO()
+        with patch('sys.stdout', new_callable=StringIO):
+            instrumentation.dump(stream)
+        stats = json.loads(stream.getvalue())
+        assert stats["games"][0]["plies"] == 1
+        calls = stats["games"][0]["turns"][0]["calls"]
+        assert calls["display_board"]["calls"] == 1
+        assert stats["turn"] == {}
+        # Until the next game starts
+        Game()
+        game.board.display_board(game)
+        calls = instrumentation.get_stats()["turn"]
+        assert calls["display_board"]["calls"] == 1
+
+    def test_resignation_ends_game(self, instrumentation):
+        game = Checkers('Kat', 'Rob')
+        with patch('builtins.input', side_effect=['Kat', 'Rob', 'r']), \
+                patch('sys.stdout', new_callable=StringIO):
+            play_game(game)
+        stats = instrumentation.get_stats()
+        game_stats, = stats["games"]
+        assert (game_stats["plies"], game_stats["result"]) == \
+            (0, WHITE_WINS)
+        turn, = game_stats["turns"]
+        assert turn["move"] is None
+        assert turn["calls"]["display_board"]["calls"] == 1
+        assert stats["turn"] == {} and stats["game"] == {}
+
+
+###################################
+# #### Tablebase tests
+###################################
+@pytest.fixture(scope="module")
+def tablebase(tmpdir_factory):
+    path = str(tmpdir_factory.mktemp("tb").join("tb2.bin"))
+    assert build_tablebase(path, max_pieces=2) == 7200
+    tablebase = Tablebase(path)
+    yield tablebase
+    tablebase.close()
+
+
+class TestTablebase:
+    def test_probe(self, tablebase):
+        assert tablebase.max_pieces == 2
+        # Black jumps 22x31
+        assert tablebase.probe(Board.from_fen("B:WK26:BK22")) == \
+            TBEntry(TB_WIN, 1)
+        # White can only move next to the black king
+        assert tablebase.probe(Board.from_fen("W:WK30:BK22")) == \
+            TBEntry(TB_LOSS, 2)
+        # Black corners the white king in 7 plies
+        assert tablebase.probe(Board.from_fen("B:WK29:BK9")) == \
+            TBEntry(TB_WIN, 7)
+        assert tablebase.probe(Board.from_fen("B:WK29:BK9,10")) is None
+
+    def test_rejects_other_files(self, tmpdir):
+        path = tmpdir.join("games.log")
+        path.write_binary(b"\x00" * 16)
+        with pytest.raises(ValueError):
+            Tablebase(str(path))
+
+    def test_ai_player_scores_from_tablebase(self, tablebase):
+        board = Board.from_fen("B:WK29:BK9")
+        player = AIPlayer(time_limit=None, max_depth=2, verbose=False,
+                          tablebase=tablebase)
+        result = player.search(board)
+        assert result.score == WIN_SCORE - 7
+        assert move_to_pdn(result.move) == "9-14"
+        assert player.tb_hits > 0
+
+
+###################################
+# #### Opening book tests
+###################################
+class TestOpeningBook:
+    ARCHIVE = """[Black "A"]
+1. 11-15 22-18 2. 15x22 1-0
+1. 11-15 23-19 1/2-1/2
+1. 9-14 22-18 0-1
+1. 11-15 22-18 *
+1. 11-20 1-0
+"""
+
+    @pytest.fixture()
+    def book_path(self, tmpdir):
+        archive = tmpdir.join("games.pdn")
+        archive.write(self.ARCHIVE)
+        path = str(tmpdir.join("book.bin"))
+        assert build_opening_book([str(archive)], path) == 6
+        return path
+
+    def test_probe(self, book_path):
+        book = OpeningBook(book_path)
+        assert len(book) == 6
+        board = Board()
+        assert book.probe(board) == [BookMove(Move((10, 14), ()), 2, 3),
+                                     BookMove(Move((8, 13), ()), 1, 0)]
+        assert book.choose_move(board) == Move((10, 14), ())
+        board.make_move(Move((10, 14), ()))
+        board.make_move(Move((21, 17), ()))
+        assert book.probe(board) == [BookMove(Move((14, 21), (17,)), 1, 2)]
+        board.make_move(Move((14, 21), (17,)))
+        assert book.probe(board) == []
+        assert book.choose_move(board) is None
+        book.close()
+
+    def test_min_games(self, tmpdir, book_path):
+        archive = tmpdir.join("games.pdn")
+        path = str(tmpdir.join("book2.bin"))
+        assert build_opening_book([str(archive)], path, min_games=2) == 1
+        assert build_opening_book([str(archive)], path, max_plies=1) == 2
+
+    def test_rejects_other_files(self, tmpdir):
+        path = tmpdir.join("tb.bin")
+        path.write_binary(b"CKTB" + b"\x00" * 12)
+        with pytest.raises(ValueError):
+            OpeningBook(str(path))
+
+    def test_ai_player_plays_book_moves(self, book_path):
+        player = AIPlayer(time_limit=None, max_depth=2, verbose=False,
+                          book=OpeningBook(book_path))
+        result = player.search(Board())
+        assert (result.move, result.depth, result.nodes) == \
+            (Move((10, 14), ()), 0, 0)
+        assert player.search(Board.from_fen("W:W18:B15")).depth > 0
+
+    def test_run_selfplay_with_book(self, tmpdir, book_path):
+        output = str(tmpdir.join("games.jsonl"))
+        run_selfplay(1, output, processes=1, time_limit=None, max_depth=1,
+                     max_plies=2, random_plies=0, book=book_path)
+        with open(output) as stream:
+            assert json.loads(stream.readline())["moves"][0] == "11-15"
+
+
+###################################
+# #### Position encoding tests
+###################################
+class TestPositionEncoding:
+    @pytest.fixture()
+    def boards(self):
+        boards = [Board(), Board.from_fen("W:W18,K26:B1-3,K32")]
+        boards[0].make_move(Move((8, 12), ()))
+        return boards
+
+    def test_encode_and_decode_board(self, boards):
+        for board in boards:
+            data = board.encode()
+            assert len(data) == 13
+            decoded = Board.decode(data)
+            assert decoded.squares == board.squares
+            assert decoded.blacks_turn == board.blacks_turn
+            assert decoded.zobrist_hash == board.zobrist_hash
+
+    def test_encode_positions_round_trip(self, boards):
+        arrays = boards_to_arrays(boards)
+        data = encode_positions(*arrays)
+        assert len(data) == 13 * len(boards)
+        assert decode_positions(data) == arrays
+        # Column layout: all black bitboards come first
+        assert data[:4] == boards[0].encode()[:4]
+
+    def test_encode_positions_length_mismatch(self, boards):
+        black, white, kings, sides = boards_to_arrays(boards)
+        pytest.raises(ValueError, encode_positions, black, white, kings,
+                      sides[:1])
+        pytest.raises(ValueError, decode_positions, b"\0" * 14)
+
+    def test_decode_positions_numpy(self, boards):
+        pytest.importorskip("numpy")
+        data = encode_positions(*boards_to_arrays(boards))
+        black, white, kings, sides = decode_positions_numpy(data)
+        assert list(black) == list(boards_to_arrays(boards)[0])
+        assert list(sides) == [0, 0]
+
+    def test_batch_move_masks(self, boards):
+        numpy = pytest.importorskip("numpy")
+        boards.append(Board.from_fen("B:W6,7,K26:B1,K30"))
+        codes = boards_to_codes(boards)
+        assert codes.shape == (3, 32)
+        moves, jumps = batch_move_masks(
+            codes, [board.blacks_turn for board in boards])
+        assert moves.shape == jumps.shape == (3, 32, 4)
+        for board, board_moves, board_jumps in zip(boards, moves, jumps):
+            first_hops = set()
+            for table, masks in ((NEIGHBOR_SQ, board_moves),
+                                 (JUMP_SQ, board_jumps)):
+                for square, direction in zip(*numpy.nonzero(masks)):
+                    first_hops.add(
+                        (square, table[DIRECTIONS[direction]][square]))
+            assert first_hops == {move.path[:2]
+                                  for move in board.generate_moves()}
+        # Jumps are mandatory
+        assert jumps[2].any() and not moves[2].any()
+
+    def test_batch_move_masks_from_strings(self, boards):
+        numpy = pytest.importorskip("numpy")
+        squares = numpy.array([board.squares for board in boards])
+        moves, jumps = batch_move_masks(squares, False)
+        expected = batch_move_masks(boards_to_codes(boards), False)
+        assert (moves == expected[0]).all()
+        assert (jumps == expected[1]).all()
+        pytest.raises(ValueError, batch_move_masks, squares[:, :8])